@@ -0,0 +1,99 @@
+from array import array
+
+ALIGNMENT_BAND = 12  # Cells either side of the expected position; drift beyond this is approximated
+UNREACHABLE = 1 << 30
+
+
+class BandedAlignment:
+    """Edit-distance alignment of the typed text against the target, kept up to date one keystroke at a time.
+
+    Row i of the DP holds the cost of aligning the first i typed characters with target prefixes j, but only
+    for a window of 2 * band + 1 values of j centred just past the previous row's best cell, so the window
+    follows the typist through skipped or doubled characters. Every cell also carries the substitutions and
+    insertions on its cheapest path (omissions are the rest of its cost). push() computes one row and pop()
+    drops one, both O(band), so backspace is as cheap as typing.
+    """
+
+    def __init__(self, target="", band=ALIGNMENT_BAND):
+        self.band = band
+        self.width = 2 * band + 1
+        self.reset(target)
+
+    def reset(self, target):
+        self.target = target
+        self._lo = array('i', [0])  # Target position of each row's first cell
+        self._best = array('i', [0])  # Target position of each row's cheapest cell
+        # Row r occupies [r * width, (r + 1) * width) of each flat column
+        self._cost = array('i', (j if j <= len(target) else UNREACHABLE for j in range(self.width)))
+        self._subs = array('i', bytes(4 * self.width))
+        self._ins = array('i', bytes(4 * self.width))
+
+    @property
+    def typed_count(self):
+        return len(self._lo) - 1
+
+    def push(self, typed_char):
+        target = self.target
+        n = len(target)
+        width = self.width
+        cost, subs, ins = self._cost, self._subs, self._ins
+        row = len(self._lo)
+        prev_lo = self._lo[-1]
+        prev_base = (row - 1) * width
+        lo = max(0, min(self._best[-1] + 1 - self.band, n))
+        best_j, best_key = lo, None
+
+        for k in range(width):
+            j = lo + k
+            if j > n:
+                cost.append(UNREACHABLE)
+                subs.append(0)
+                ins.append(0)
+                continue
+            c, s, i = UNREACHABLE, 0, 0
+            p = prev_base + j - 1 - prev_lo  # Typed char aligned with target[j - 1]: match or substitution
+            if j >= 1 and 0 <= j - 1 - prev_lo < width and cost[p] < UNREACHABLE:
+                mismatch = typed_char != target[j - 1]
+                c, s, i = cost[p] + mismatch, subs[p] + mismatch, ins[p]
+            p = prev_base + j - prev_lo  # Typed char not in the target: insertion
+            if 0 <= j - prev_lo < width and cost[p] + 1 < c:
+                c, s, i = cost[p] + 1, subs[p], ins[p] + 1
+            if k > 0 and cost[-1] + 1 < c:  # target[j - 1] skipped: omission
+                c, s, i = cost[-1] + 1, subs[-1], ins[-1]
+            cost.append(c)
+            subs.append(s)
+            ins.append(i)
+            key = (c, abs(j - row), -j)  # Cheapest, then closest to the diagonal, then furthest along
+            if best_key is None or key < best_key:
+                best_j, best_key = j, key
+
+        self._lo.append(lo)
+        self._best.append(best_j)
+
+    def pop(self):
+        """Undoes the last push (backspace)."""
+        if len(self._lo) == 1:
+            return
+        del self._lo[-1]
+        del self._best[-1]
+        for column in (self._cost, self._subs, self._ins):
+            del column[-self.width:]
+
+    def _counts_at(self, k, untyped=0):
+        base = self.typed_count * self.width
+        cost, substitutions, insertions = self._cost[base + k], self._subs[base + k], self._ins[base + k]
+        return {'insertions': insertions, 'omissions': cost - substitutions - insertions + untyped,
+                'substitutions': substitutions}
+
+    def counts(self):
+        """Errors on the best alignment of what has been typed so far; the rest of the target isn't counted."""
+        return self._counts_at(self._best[-1] - self._lo[-1])
+
+    def final_counts(self):
+        """Errors against the whole target: anything after the last aligned character is an omission."""
+        n = len(self.target)
+        base = self.typed_count * self.width
+        lo = self._lo[-1]
+        k = min((k for k in range(self.width) if lo + k <= n),
+                key=lambda k: (self._cost[base + k] + n - (lo + k), -k))
+        return self._counts_at(k, n - (lo + k))
@@ -0,0 +1,78 @@
+try:
+    import numpy as np
+except ImportError:  # Optional: without NumPy the stats screen just says it is unavailable
+    np = None
+
+ROLLING_WINDOW = 10  # Sessions averaged by the rolling mean
+RECENT_SESSIONS = 10  # "Recent" average covers this many of the latest sessions
+PERCENTILES = (10, 25, 50, 75, 90)
+
+
+def numpy_available():
+    return np is not None
+
+
+def rolling_mean(values, window=ROLLING_WINDOW):
+    """Mean of each run of `window` consecutive values (shorter histories use their whole length)."""
+    window = max(1, min(window, len(values)))
+    sums = np.cumsum(np.concatenate(([0.0], values)))
+    return (sums[window:] - sums[:-window]) / window
+
+
+def compute_stats(history):
+    """Summarises a user's sessions (oldest first) with vectorised NumPy operations; None if there are none."""
+    n = len(history)
+    if not n:
+        return None
+    wpm = np.fromiter((session["wpm"] for session in history), dtype=np.float64, count=n)
+    accuracy = np.fromiter((session["accuracy"] for session in history), dtype=np.float64, count=n)
+
+    if n >= 2:
+        trend = np.polyfit(np.arange(n, dtype=np.float64), wpm, 1)[0]  # Least-squares WPM gained per session
+    else:
+        trend = 0.0
+    if n >= 2 and wpm.std() > 0 and accuracy.std() > 0:
+        correlation = float(np.corrcoef(wpm, accuracy)[0, 1])
+    else:
+        correlation = None  # Undefined without variation in both
+
+    return {
+        "sessions": n,
+        "mean_wpm": float(wpm.mean()),
+        "best_wpm": float(wpm.max()),
+        "recent_wpm": float(wpm[-RECENT_SESSIONS:].mean()),
+        "percentiles": dict(zip(PERCENTILES, (float(v) for v in np.percentile(wpm, PERCENTILES)))),
+        "trend_per_session": float(trend),
+        "stddev_wpm": float(wpm.std()),
+        "mean_accuracy": float(accuracy.mean()),
+        "accuracy_speed_correlation": correlation,
+        "wpm": wpm,
+        "rolling_wpm": rolling_mean(wpm),
+    }
+
+
+def graph_points(values, first_index, session_count, rect, max_value):
+    """Screen points for values[i] plotted at session first_index + i in rect, at most about one per pixel column."""
+    step = max(1, len(values) // rect.width)
+    indices = np.arange(0, len(values), step)
+    xs = rect.x + (indices + first_index) / max(1, session_count - 1) * rect.width
+    ys = rect.bottom - values[indices] / max_value * rect.height
+    return list(zip(xs.tolist(), ys.tolist()))
+
+
+class UserAnalytics:
+    """compute_stats results cached per user until invalidate() is called for them."""
+
+    def __init__(self):
+        self._stats = {}  # {username: stats dict or None}
+
+    def get(self, username, history):
+        """Returns username's stats, computing them from history only if they aren't cached."""
+        if np is None:
+            return None
+        if username not in self._stats:
+            self._stats[username] = compute_stats(history)
+        return self._stats[username]
+
+    def invalidate(self, username):
+        self._stats.pop(username, None)
@@ -0,0 +1,150 @@
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+import pygame
+
+from storage import atomic_write
+
+ASSET_WORKERS = 4
+ASSET_CACHE_VERSION = 1
+ASSET_CACHE_MAGIC = b'TSMA'
+# magic, version, width, height, source file size, source mtime_ns
+ASSET_CACHE_HEADER = struct.Struct('<4sBxHHQQ')
+ASSET_CACHE_FORMAT = "BGRA"  # Byte order of the usual 32-bit display surface, so convert() is a plain copy
+
+
+def resolve_path(path):
+    """path if it exists, otherwise the existing path whose components match it case-insensitively, or None.
+
+    The assets are referred to as e.g. 'assets/audio/...', which only exists on case-insensitive filesystems
+    if the folder is really called 'Audio'.
+    """
+    if os.path.exists(path):
+        return path
+    parent, name = os.path.split(path)
+    if parent:
+        parent = resolve_path(parent)
+        if parent is None:
+            return None
+    try:
+        entries = os.listdir(parent or '.')
+    except OSError:
+        return None
+    name = name.lower()
+    for entry in entries:
+        if entry.lower() == name:
+            return os.path.join(parent, entry)
+    return None
+
+
+class AssetManager:
+    """Loads images and sounds on a thread pool so the first frame never waits for them.
+
+    load_image() and load_sound() only queue a job; start() hands the queue to the pool. The game calls it
+    once its first frame is on screen, since decoding holds the GIL and would otherwise slow that frame down.
+    Until poll() hands an asset over, the game keeps its placeholder (no sound, a plain themed background).
+    poll() runs on the main thread, which is where images are converted to the display format. Scaled
+    images can be cached on disk, already in the display's pixel layout, which skips decoding and scaling
+    on later launches.
+    """
+
+    def __init__(self, cache_dir, workers=ASSET_WORKERS):
+        self.cache_dir = cache_dir
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="assets")
+        self._queued = []  # [(name, kind, function, args)] waiting for start()
+        self._jobs = []  # [(name, kind, future)]
+
+    @property
+    def pending(self):
+        return bool(self._queued or self._jobs)
+
+    def load_sound(self, name, path):
+        self._queued.append((name, "sound", self._read_sound, (path,)))
+
+    def load_image(self, name, path, size, cache_name=None):
+        """Queues path, scaled to size; with cache_name the scaled pixels are cached on disk under that name."""
+        cache_path = os.path.join(self.cache_dir, f"{cache_name}_{size[0]}x{size[1]}.px") if cache_name else None
+        self._queued.append((name, "image", self._read_image, (path, size, cache_path)))
+
+    def start(self):
+        """Starts loading everything queued so far."""
+        for name, kind, function, args in self._queued:
+            self._jobs.append((name, kind, self._executor.submit(function, *args)))
+        self._queued = []
+
+    def _read_sound(self, path):
+        resolved = resolve_path(path)
+        if resolved is None:
+            raise FileNotFoundError(path)
+        return pygame.mixer.Sound(resolved)
+
+    def _read_image(self, path, size, cache_path):
+        """Returns (surface, (cache_path, source stat) if the converted surface should be cached, else None)."""
+        resolved = resolve_path(path)
+        if resolved is None:
+            raise FileNotFoundError(path)
+        source = os.stat(resolved)
+        if cache_path:
+            surface = self._read_cached_image(cache_path, size, source)
+            if surface is not None:
+                return surface, None
+        surface = pygame.transform.scale(pygame.image.load(resolved), size)
+        return surface, (cache_path, source) if cache_path else None
+
+    def _read_cached_image(self, cache_path, size, source):
+        try:
+            with open(cache_path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        if len(data) != ASSET_CACHE_HEADER.size + 4 * size[0] * size[1]:
+            return None
+        header = ASSET_CACHE_HEADER.unpack_from(data)
+        if header != (ASSET_CACHE_MAGIC, ASSET_CACHE_VERSION, size[0], size[1], source.st_size, source.st_mtime_ns):
+            return None  # Stale: the source image changed since it was cached
+        return pygame.image.frombuffer(data[ASSET_CACHE_HEADER.size:], size, ASSET_CACHE_FORMAT)
+
+    def _write_cached_image(self, cache_path, source, surface):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            header = ASSET_CACHE_HEADER.pack(ASSET_CACHE_MAGIC, ASSET_CACHE_VERSION, *surface.get_size(),
+                                             source.st_size, source.st_mtime_ns)
+            atomic_write(cache_path, header + pygame.image.tobytes(surface, ASSET_CACHE_FORMAT), "never")
+        except (OSError, pygame.error) as e:
+            print(f"Warning: Could not write asset cache {cache_path}: {e}")
+
+    def poll(self):
+        """[(name, asset)] for every job finished since the last call; failed loads come back as None."""
+        finished, remaining = [], []
+        for job in self._jobs:
+            name, kind, future = job
+            if not future.done():
+                remaining.append(job)
+                continue
+            try:
+                result = future.result()
+            except FileNotFoundError as e:
+                print(f"Warning: Asset file not found: {e}. Skipping it.")
+                result = None
+            except pygame.error as e:
+                print(f"Warning: Could not load asset '{name}' due to Pygame error: {e}. Skipping it.")
+                result = None
+            if kind == "image" and result is not None:
+                surface, cache_entry = result
+                result = surface.convert()  # The display isn't thread-safe, so this happens here
+                if cache_entry:
+                    self._executor.submit(self._write_cached_image, *cache_entry, result)
+            finished.append((name, result))
+        self._jobs = remaining
+        return finished
+
+    def wait(self):
+        """Starts the queue and blocks until every asset has loaded, then returns poll()'s result."""
+        self.start()
+        for _, _, future in self._jobs:
+            future.exception()
+        return self.poll()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
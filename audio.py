@@ -0,0 +1,110 @@
+import time
+from array import array
+
+import pygame
+
+from profiler import RingBuffer, percentile
+
+AUDIO_FREQUENCY = 44100
+AUDIO_BUFFER = 256  # Samples per mixer buffer: ~6 ms at 44.1 kHz, against pygame's default of 512
+AUDIO_CHANNELS = 16  # Mixer channels in total
+CHANNEL_POOLS = {"key": 4, "error": 2}  # Channels reserved per pool; sounds in no pool use the rest
+SILENCE_THRESHOLD = 0.02  # Leading samples quieter than this fraction of full scale are trimmed
+TRIM_PREROLL_MS = 2  # Kept before the first audible sample so the attack doesn't click
+LATENCY_SAMPLES = 512  # Keystroke-to-sound latencies kept for the report
+
+
+class AudioEngine:
+    """Owns the mixer: a small buffer, reserved channel pools for the sounds that fire on every keystroke, and
+    samples decoded and trimmed up front so play() only starts a channel.
+
+    A pool's channels are reserved, so other sounds never take them. When all of a pool's channels are busy,
+    play() steals the one that started longest ago. Each play() given the time its keystroke was read is
+    recorded as a keystroke-to-sound latency: the time until play() plus one mixer buffer. The OS's own
+    input and output latency comes on top and can't be seen from here.
+    """
+
+    def __init__(self, frequency=AUDIO_FREQUENCY, buffer=AUDIO_BUFFER, channels=AUDIO_CHANNELS,
+                 pools=CHANNEL_POOLS):
+        self.frequency = frequency
+        self.buffer = buffer
+        self.channels = channels
+        self.pools = dict(pools)
+        self.available = False
+        self._sounds = {}  # {name: (Sound, pool or None)}
+        self._pool_channels = {}  # {pool: [Channel]}
+        self._started_ns = {}  # {id(Channel): perf_counter_ns of its last play()}
+        self.latencies = RingBuffer(LATENCY_SAMPLES)  # Nanoseconds
+        self.voices_stolen = 0
+
+    def open(self):
+        """Opens the audio device. False (and every play() a no-op) if there isn't one."""
+        try:
+            pygame.mixer.init(frequency=self.frequency, size=-16, channels=2, buffer=self.buffer)
+        except pygame.error as e:
+            print(f"Warning: Could not open the audio device: {e}. Continuing without sound.")
+            return False
+        pygame.mixer.set_num_channels(max(self.channels, sum(self.pools.values()) + 1))
+        pygame.mixer.set_reserved(sum(self.pools.values()))  # Reserved channels are the lowest-numbered
+        first = 0
+        for pool, count in self.pools.items():
+            self._pool_channels[pool] = [pygame.mixer.Channel(i) for i in range(first, first + count)]
+            first += count
+        self.available = True
+        return True
+
+    @property
+    def buffer_ms(self):
+        return self.buffer / self.frequency * 1000
+
+    def add_sound(self, name, sound, volume=1.0, pool=None):
+        """Registers a loaded Sound under name, trimmed of leading silence; pool is a CHANNEL_POOLS key or None."""
+        sound = trim_leading_silence(sound)
+        sound.set_volume(volume)
+        self._sounds[name] = (sound, pool if pool in self._pool_channels else None)
+
+    def play(self, name, input_ns=None):
+        """Plays a registered sound; input_ns is when the keystroke that caused it was read, if there was one."""
+        entry = self._sounds.get(name)
+        if entry is None:
+            return
+        sound, pool = entry
+        if pool is None:
+            sound.play()
+        else:
+            channels = self._pool_channels[pool]
+            channel = next((c for c in channels if not c.get_busy()), None)
+            if channel is None:
+                channel = min(channels, key=lambda c: self._started_ns.get(id(c), 0))
+                self.voices_stolen += 1
+            channel.play(sound)
+            self._started_ns[id(channel)] = time.perf_counter_ns()
+        if input_ns is not None:
+            self.latencies.append(time.perf_counter_ns() - input_ns + int(self.buffer_ms * 1e6))
+
+    def latency_summary(self):
+        """{'count', 'p50_ms', 'p95_ms', 'max_ms'} of the recorded keystroke-to-sound latencies."""
+        values = sorted(self.latencies.values())
+        return {
+            "count": len(values),
+            "p50_ms": percentile(values, 0.5) / 1e6,
+            "p95_ms": percentile(values, 0.95) / 1e6,
+            "max_ms": values[-1] / 1e6 if values else 0,
+        }
+
+
+def trim_leading_silence(sound):
+    """A copy of sound starting just before its first audible sample (the sound itself if it has none, or the
+    mixer isn't signed 16-bit)."""
+    frequency, size, channels = pygame.mixer.get_init()
+    if size != -16:
+        return sound
+    samples = array('h', sound.get_raw())
+    threshold = int(32767 * SILENCE_THRESHOLD)
+    first = next((i for i, sample in enumerate(samples) if abs(sample) > threshold), None)
+    if first is None:
+        return sound
+    start_frame = max(0, first // channels - frequency * TRIM_PREROLL_MS // 1000)
+    if start_frame == 0:
+        return sound
+    return pygame.mixer.Sound(buffer=samples[start_frame * channels:].tobytes())
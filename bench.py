@@ -0,0 +1,408 @@
+"""Headless benchmark for Typing Speed Master.
+
+Runs Game under SDL's dummy video/audio drivers, drives it with synthetic mouse and KEYDOWN events, and
+records how long _handle_events, _update_game_state and _draw_ui take on every frame, grouped by game state.
+It also starts the game in fresh interpreters to time startup (importing main, opening the window, the first
+menu frame) against STARTUP_BUDGET_MS.
+
+    python bench.py                      # Run and compare against bench_baseline.json if it exists
+    python bench.py --save-baseline      # Run and store the results as the new baseline
+    python bench.py --wpm 120 --error-rate 0.1 --paragraph-length 2000 --overflow 40
+
+Exits with status 1 if any phase regressed past the tolerance or startup is over budget, so it can gate a
+release build.
+"""
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")  # Must be set before pygame is imported
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import pygame
+from pygame.locals import K_BACKSPACE, K_DOWN, K_ESCAPE, K_RETURN, KEYDOWN, MOUSEBUTTONDOWN, MOUSEMOTION
+
+import main
+from profiler import percentile
+
+BASELINE_FILE = 'bench_baseline.json'
+RESULTS_FILE = 'bench_results.json'
+PHASES = ("_handle_events", "_update_game_state", "_draw_ui")
+STATE_NAMES = {main.MENU: "MENU", main.TYPING: "TYPING", main.RESULTS: "RESULTS",
+               main.PARAGRAPH_SELECT: "PARAGRAPH_SELECT", main.COUNTDOWN: "COUNTDOWN",
+               main.USER_SELECT: "USER_SELECT", main.CREATE_USER: "CREATE_USER", main.LEADERBOARD: "LEADERBOARD",
+               main.STATS: "STATS"}
+FALLBACK_TEXT = "The quick brown fox jumps over the lazy dog."
+TYPO_CHARS = "abcdefghijklmnopqrstuvwxyz"
+
+DEFAULT_WPM = 80
+DEFAULT_ERROR_RATE = 0.05  # Chance that a character is mistyped (then fixed with backspace)
+DEFAULT_PARAGRAPH_LENGTH = 600  # Characters
+DEFAULT_OVERFLOW = 20  # Extra characters typed past the end of the paragraph before Enter
+DEFAULT_STATIC_FRAMES = 120  # Frames measured on each non-typing screen
+DEFAULT_TOLERANCE = 0.25  # Allowed slowdown of a phase's p95 over the baseline (0.25 = 25%)
+MIN_REGRESSION_US = 50  # Ignore slowdowns smaller than this, they are timer noise
+DEFAULT_STARTUP_RUNS = 5  # Fresh interpreters started per startup measurement; medians are reported
+# Milliseconds from the top of a fresh interpreter until main is imported, the window is open and the first
+# menu frame has been handled
+STARTUP_BUDGET_MS = {"import_ms": 400, "window_ms": 450, "menu_ms": 500}
+# Runs in each fresh interpreter (argv: users.json path, users.db path) and prints the timings as JSON
+STARTUP_SCRIPT = """
+import json, sys, time
+started = time.perf_counter_ns()
+import main
+imported = time.perf_counter_ns()
+main.USERS_FILE, main.USERS_DB_FILE = sys.argv[1], sys.argv[2]
+game = main.Game()
+game._set_theme(main.DEFAULT_THEME)
+game._handle_events()
+game._update_game_state()
+game._draw_ui()
+interactive = time.perf_counter_ns()
+window = game._init_start_ns + int(game.window_ms * 1e6)
+game.user_store.close()
+game.persistence.stop()
+game.assets.shutdown()
+main.pygame.quit()
+print(json.dumps({"import_ms": (imported - started) / 1e6, "window_ms": (window - started) / 1e6,
+                  "menu_ms": (interactive - started) / 1e6}))
+"""
+
+
+class FrameRecorder:
+    """Per-state, per-phase frame timings in nanoseconds."""
+
+    def __init__(self):
+        self.samples = {}  # {state name: {phase: [ns, ...]}}
+
+    def record(self, state, phase, elapsed_ns):
+        phases = self.samples.setdefault(STATE_NAMES.get(state, str(state)), {})
+        phases.setdefault(phase, []).append(elapsed_ns)
+
+    def summary(self):
+        return {state: {phase: summarize(values) for phase, values in phases.items()}
+                for state, phases in self.samples.items()}
+
+
+def summarize(values_ns):
+    ordered = sorted(values_ns)
+    to_us = lambda ns: round(ns / 1000, 1)
+    return {
+        "frames": len(ordered),
+        "mean_us": to_us(sum(ordered) / len(ordered)) if ordered else 0,
+        "p50_us": to_us(percentile(ordered, 0.50)),
+        "p95_us": to_us(percentile(ordered, 0.95)),
+        "p99_us": to_us(percentile(ordered, 0.99)),
+        "max_us": to_us(ordered[-1]) if ordered else 0,
+    }
+
+
+def make_paragraph(length, source=main.SENTENCES_FILE):
+    """Real sentences from the corpus, repeated and cut at a word boundary near length characters."""
+    try:
+        with open(source, 'r', encoding='utf-8') as f:
+            sentences = [line.strip() for line in f if line.strip()]
+    except OSError:
+        sentences = []
+    sentences = sentences or [FALLBACK_TEXT]
+    words = []
+    total = 0
+    i = 0
+    while total < length:
+        for word in sentences[i % len(sentences)].split():
+            words.append(word)
+            total += len(word) + 1
+        i += 1
+    return ' '.join(words)[:length].rstrip()
+
+
+def key_event(key, unicode=''):
+    return pygame.event.Event(KEYDOWN, key=key, unicode=unicode, mod=0, scancode=0)
+
+
+def char_event(char):
+    return key_event(ord(char.lower()) if ord(char) < 128 else 0, char)
+
+
+def keystroke_stream(paragraph, error_rate, overflow, rng):
+    """KEYDOWN events typing paragraph with typos fixed by backspace, overflow extra characters, then Enter."""
+    events = []
+    for char in paragraph:
+        if rng.random() < error_rate:
+            events.append(char_event(rng.choice(TYPO_CHARS.replace(char.lower(), ''))))
+            events.append(key_event(K_BACKSPACE))
+        events.append(char_event(char))
+    for _ in range(overflow):
+        events.append(char_event(rng.choice(TYPO_CHARS)))
+    events.append(key_event(K_RETURN))
+    return events
+
+
+def click_events(button):
+    pos = button.rect.center
+    return [pygame.event.Event(MOUSEMOTION, pos=pos, rel=(0, 0), buttons=(0, 0, 0)),
+            pygame.event.Event(MOUSEBUTTONDOWN, pos=pos, button=1)]
+
+
+def hover_events(buttons, frame):
+    """Moves the mouse onto a different button (or off all of them) every few frames."""
+    if frame % 10:
+        return []
+    targets = [button.rect.center for button in buttons] + [(5, main.SCREEN_HEIGHT - 5)]
+    pos = targets[(frame // 10) % len(targets)]
+    return [pygame.event.Event(MOUSEMOTION, pos=pos, rel=(0, 0), buttons=(0, 0, 0))]
+
+
+class Benchmark:
+    def __init__(self, game, recorder, clock=None):
+        self.game = game
+        self.recorder = recorder
+        self.clock = clock  # pygame Clock when running at real speed, else frames run back to back
+
+    def frame(self, events=()):
+        """Posts events, then runs and times one iteration of Game.run's loop."""
+        for event in events:
+            pygame.event.post(event)
+        game = self.game
+        state = game.current_state  # Attribute the whole frame to the state it started in
+        for phase in PHASES:
+            method = getattr(game, phase)
+            start = time.perf_counter_ns()
+            method()
+            self.recorder.record(state, phase, time.perf_counter_ns() - start)
+        if self.clock:
+            self.clock.tick(main.FPS)
+
+    def idle(self, frames, buttons=()):
+        for i in range(frames):
+            self.frame(hover_events(buttons, i))
+
+    def run_scenario(self, args, rng):
+        game = self.game
+        frames = args.static_frames
+
+        self.idle(frames, [game.start_button, game.select_paragraph_button, game.manage_users_button])
+
+        self.frame(click_events(game.select_paragraph_button))
+        for i in range(frames):
+            events = hover_events(game.paragraph_buttons, i)
+            if i % 15 == 0:
+                events.append(key_event(K_DOWN))
+            self.frame(events)
+        self.frame([key_event(K_ESCAPE)])
+
+        self.frame(click_events(game.leaderboard_button))
+        self.idle(frames, list(game.leaderboard_tab_buttons.values()))
+        self.frame(click_events(game.back_to_menu_button))
+
+        self.frame(click_events(game.start_button))
+        self.idle(min(frames, main.FPS))
+        game.countdown_start_time -= 3000  # Skip the rest of the 3 second countdown
+
+        self.type_paragraph(args, rng)
+        self.idle(frames, [game.restart_button, game.back_to_menu_button])
+
+    def type_paragraph(self, args, rng):
+        """Feeds the keystroke stream at args.wpm (5 characters per word) until the game leaves TYPING."""
+        game = self.game
+        while game.current_state == main.COUNTDOWN:
+            self.frame()
+        keys_per_frame = args.wpm * 5 / 60 / main.FPS
+        stream = keystroke_stream(game.target_paragraph, args.error_rate, args.overflow, rng)
+        budget = 0.0
+        position = 0
+        while game.current_state == main.TYPING:
+            budget += keys_per_frame
+            count = int(budget)
+            budget -= count
+            self.frame(stream[position:position + count])
+            position += count
+            if position > len(stream) + main.FPS:
+                print("Warning: Game is still in TYPING after the whole keystroke stream was sent.")
+                break
+
+
+def run_benchmark(args):
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory(prefix="tsm-bench-") as workdir:
+        # Keep the player's users.db and sentences.txt untouched
+        sentences_path = os.path.join(workdir, 'sentences.txt')
+        with open(sentences_path, 'w', encoding='utf-8') as f:
+            f.write(make_paragraph(args.paragraph_length) + "\n")
+        main.SENTENCES_FILE = sentences_path
+        main.USERS_FILE = os.path.join(workdir, 'users.json')
+        main.USERS_DB_FILE = os.path.join(workdir, 'users.db')
+
+        game = main.Game()
+        game._set_theme(main.DEFAULT_THEME)
+        game._create_user("bench")
+        recorder = FrameRecorder()
+        benchmark = Benchmark(game, recorder, pygame.time.Clock() if args.realtime else None)
+        started = time.perf_counter()
+        try:
+            benchmark.run_scenario(args, rng)
+        finally:
+            game.user_store.close()
+            game.persistence.stop()
+            game.assets.shutdown()
+            if isinstance(game.paragraphs, main.LineCorpus):
+                game.paragraphs.close()
+            pygame.quit()
+        wall_time = time.perf_counter() - started
+
+    return {
+        "config": {
+            "wpm": args.wpm,
+            "error_rate": args.error_rate,
+            "paragraph_length": args.paragraph_length,
+            "overflow": args.overflow,
+            "static_frames": args.static_frames,
+            "realtime": args.realtime,
+            "seed": args.seed,
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "pygame": pygame.version.ver,
+            "platform": platform.platform(),
+        },
+        "wall_time_s": round(wall_time, 3),
+        "states": recorder.summary(),
+    }
+
+
+def measure_startup(runs):
+    """Median startup timings over `runs` fresh interpreters, or None if the game failed to start."""
+    samples = {metric: [] for metric in STARTUP_BUDGET_MS}
+    with tempfile.TemporaryDirectory() as directory:
+        for i in range(runs):
+            users_files = [os.path.join(directory, f'users{i}.json'), os.path.join(directory, f'users{i}.db')]
+            try:
+                output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT] + users_files, capture_output=True,
+                                        text=True, check=True).stdout
+                timings = json.loads(output.strip().splitlines()[-1])
+            except (subprocess.CalledProcessError, ValueError, IndexError) as e:
+                print(f"Error: Startup measurement failed: {e}")
+                return None
+            for metric in samples:
+                samples[metric].append(timings[metric])
+    return {metric: round(statistics.median(values), 1) for metric, values in samples.items()}
+
+
+def check_startup_budget(startup):
+    """[(metric, measured ms, budget ms)] for every startup timing over STARTUP_BUDGET_MS."""
+    if not startup:
+        return []
+    return [(metric, startup[metric], budget) for metric, budget in STARTUP_BUDGET_MS.items()
+            if startup[metric] > budget]
+
+
+def compare(results, baseline, tolerance):
+    """Returns [(state, phase, baseline p95, current p95)] for phases whose p95 regressed past tolerance."""
+    regressions = []
+    for state, phases in results["states"].items():
+        for phase, current in phases.items():
+            previous = baseline.get("states", {}).get(state, {}).get(phase)
+            if not previous:
+                continue
+            slower_by = current["p95_us"] - previous["p95_us"]
+            if slower_by > MIN_REGRESSION_US and current["p95_us"] > previous["p95_us"] * (1 + tolerance):
+                regressions.append((state, phase, previous["p95_us"], current["p95_us"]))
+    return regressions
+
+
+def print_summary(results):
+    print(f"{'state':<18}{'phase':<20}{'frames':>8}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (us)")
+    for state, phases in results["states"].items():
+        for phase in PHASES:
+            stats = phases.get(phase)
+            if stats:
+                print(f"{state:<18}{phase:<20}{stats['frames']:>8}{stats['mean_us']:>10}{stats['p50_us']:>10}"
+                      f"{stats['p95_us']:>10}{stats['p99_us']:>10}{stats['max_us']:>10}")
+
+
+def print_startup(startup):
+    if startup:
+        print("startup (median ms): " + ", ".join(f"{metric} {startup[metric]} (budget {STARTUP_BUDGET_MS[metric]})"
+                                                  for metric in STARTUP_BUDGET_MS))
+
+
+def write_json(path, data):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=4)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Headless frame-time benchmark for Typing Speed Master.")
+    parser.add_argument("--wpm", type=float, default=DEFAULT_WPM, help="typing speed of the synthetic player")
+    parser.add_argument("--error-rate", type=float, default=DEFAULT_ERROR_RATE,
+                        help="chance that a character is mistyped and corrected with backspace")
+    parser.add_argument("--paragraph-length", type=int, default=DEFAULT_PARAGRAPH_LENGTH,
+                        help="length of the typed paragraph in characters")
+    parser.add_argument("--overflow", type=int, default=DEFAULT_OVERFLOW,
+                        help="characters typed past the end of the paragraph before Enter")
+    parser.add_argument("--static-frames", type=int, default=DEFAULT_STATIC_FRAMES,
+                        help="frames measured on each non-typing screen")
+    parser.add_argument("--realtime", action="store_true", help="run at FPS instead of as fast as possible")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=RESULTS_FILE, help="where to write the JSON results")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="JSON results to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed p95 slowdown per phase before it counts as a regression")
+    parser.add_argument("--startup-runs", type=int, default=DEFAULT_STARTUP_RUNS,
+                        help="fresh interpreters to time startup in (0 skips the startup benchmark)")
+    return parser.parse_args(argv)
+
+
+def run(argv=None):
+    args = parse_args(argv)
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))  # Game loads its assets relative to the repo
+
+    results = run_benchmark(args)
+    results["startup"] = measure_startup(args.startup_runs) if args.startup_runs > 0 else None
+    print_summary(results)
+    print_startup(results["startup"])
+    write_json(args.output, results)
+    print(f"Results written to {args.output} ({results['wall_time_s']} s).")
+
+    over_budget = check_startup_budget(results["startup"])
+    for metric, measured, budget in over_budget:
+        print(f"OVER BUDGET startup {metric}: {measured} ms > {budget} ms")
+    status = 1 if over_budget else 0
+
+    if args.save_baseline:
+        write_json(args.baseline, results)
+        print(f"Baseline saved to {args.baseline}.")
+        return status
+
+    try:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one.")
+        return status
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Error: Could not read baseline {args.baseline}: {e}")
+        return 1
+
+    if baseline.get("config") != results["config"]:
+        print("Warning: Baseline was recorded with a different configuration; comparison may be meaningless.")
+    regressions = compare(results, baseline, args.tolerance)
+    for state, phase, before, after in regressions:
+        print(f"REGRESSION {state} {phase}: p95 {before} us -> {after} us")
+    if regressions:
+        return 1
+    print(f"No regressions against {args.baseline} (tolerance {args.tolerance * 100:.0f}%).")
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(run())
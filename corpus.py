@@ -0,0 +1,274 @@
+import mmap
+import os
+import queue
+import random
+import re
+import struct
+import threading
+from array import array
+from bisect import bisect_left
+
+INDEX_SUFFIX = '.idx'
+INDEX_MAGIC = b'TSMIDX1\0'
+# magic, source size, source mtime (ns), line count
+INDEX_HEADER = struct.Struct('=8sQQQ')  # Native byte order, like the offsets that follow
+
+SEARCH_INDEX_SUFFIX = '.tok'
+SEARCH_INDEX_MAGIC = b'TSMTOK2\0'
+# magic, source size, source mtime (ns), line count, token count, byte length of the token list
+SEARCH_INDEX_HEADER = struct.Struct('=8sQQQQQ')  # Native byte order, like the arrays that follow
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+class LineCorpus:
+    """Random access to the non-blank lines of a (possibly huge) text file without loading it.
+
+    The file is memory-mapped and an index of (start, end) byte offsets for every non-blank line is
+    built once and cached next to it as <file>.idx. The cache is itself memory-mapped, so opening a
+    corpus with millions of lines costs the same as opening a small one.
+    """
+
+    def __init__(self, path, index_path=None):
+        self.path = path
+        self.index_path = index_path or path + INDEX_SUFFIX
+        self._file = open(path, 'rb')  # Raises FileNotFoundError like the old open()
+        stat = os.fstat(self._file.fileno())
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b''
+        self._index_file = None
+        self._index_map = None
+        self._offsets = self._load_index(stat) or self._build_index(stat)
+
+    def __len__(self):
+        return len(self._offsets) // 2
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        start, end = self._offsets[2 * index], self._offsets[2 * index + 1]
+        return self._data[start:end].decode('utf-8', errors='replace').strip()
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def random_index(self):
+        """Uniformly random line index."""
+        return random.randrange(len(self))
+
+    def _load_index(self, stat):
+        """Maps a cached index if it matches the source file, else returns None."""
+        try:
+            self._index_file = open(self.index_path, 'rb')
+            self._index_map = mmap.mmap(self._index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            self._close_index()
+            return None
+        if len(self._index_map) >= INDEX_HEADER.size:
+            magic, size, mtime_ns, count = INDEX_HEADER.unpack_from(self._index_map)
+            if (magic == INDEX_MAGIC and size == stat.st_size and mtime_ns == stat.st_mtime_ns and
+                    len(self._index_map) == INDEX_HEADER.size + count * 16):
+                return memoryview(self._index_map)[INDEX_HEADER.size:].cast('Q')
+        self._close_index()
+        return None
+
+    def _build_index(self, stat):
+        """Scans the file for non-blank lines and caches their offsets. Returns the offsets."""
+        offsets = bytearray()
+        pack = struct.Struct('=QQ').pack
+        data = self._data
+        start = 0
+        size = len(data)
+        while start < size:
+            end = data.find(b'\n', start)
+            if end == -1:
+                end = size
+            if data[start:end].strip():
+                offsets += pack(start, end)
+            start = end + 1
+        count = len(offsets) // 16
+
+        try:
+            with open(self.index_path, 'wb') as f:
+                f.write(INDEX_HEADER.pack(INDEX_MAGIC, stat.st_size, stat.st_mtime_ns, count))
+                f.write(offsets)
+        except OSError as e:
+            print(f"Warning: Could not cache line index {self.index_path}: {e}")
+        return memoryview(bytes(offsets)).cast('Q')
+
+    def _close_index(self):
+        if self._index_map is not None:
+            self._index_map.close()
+            self._index_map = None
+        if self._index_file is not None:
+            self._index_file.close()
+            self._index_file = None
+
+    def close(self):
+        self._offsets.release()
+        self._close_index()
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class SearchIndex:
+    """Inverted token index over corpus lines for type-to-filter search.
+
+    The index is built (or loaded from <file>.tok) on a background thread, and queries given to submit() run
+    on the same thread after it, so a broad query on a huge corpus never holds up a frame; poll() hands the
+    results back. search() returns None until the index is ready. Every query word must match a whole
+    token, except the last, which matches as a prefix so results narrow while the user is still typing it.
+    """
+
+    def __init__(self, lines, source_path=None):
+        self.lines = lines
+        self.source_path = source_path
+        self.cache_path = source_path + SEARCH_INDEX_SUFFIX if source_path else None
+        self._postings = {}  # {token: array('I') of line indices, ascending}
+        self._tokens = []  # Sorted tokens, for prefix lookups
+        self.ready = False
+        self._queries = queue.Queue()  # (query, generation) for the index thread
+        self._generation = 0  # Bumped per submit(); queries that are no longer the latest are skipped
+        self._result = None  # (generation, query, results) of the last query the index thread finished
+        self._thread = threading.Thread(target=self._run, name="search-index", daemon=True)
+        self._thread.start()
+
+    def _source_stamp(self):
+        stat = os.stat(self.source_path)
+        return stat.st_size, stat.st_mtime_ns, len(self.lines)
+
+    def _run(self):
+        self._load_or_build()
+        while True:
+            query, generation = self._queries.get()
+            if generation == self._generation:  # Skip queries the user has typed on from
+                self._result = (generation, query, self.search(query))
+
+    def _load_or_build(self):
+        if not (self.cache_path and self._load()):
+            self._build()
+            if self.cache_path:
+                self._save()
+        self._tokens = sorted(self._postings)
+        self.ready = True
+
+    def _load(self):
+        """Reads a cached index if it matches the source file. Never executes anything from the file."""
+        try:
+            with open(self.cache_path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return False
+        if len(data) < SEARCH_INDEX_HEADER.size:
+            return False
+        magic, size, mtime_ns, line_count, token_count, token_bytes = SEARCH_INDEX_HEADER.unpack_from(data)
+        if magic != SEARCH_INDEX_MAGIC or (size, mtime_ns, line_count) != self._source_stamp():
+            return False
+        position = SEARCH_INDEX_HEADER.size
+        counts = array('I')
+        counts_end = position + token_bytes + counts.itemsize * token_count
+        if len(data) < counts_end:
+            return False
+        try:
+            tokens = data[position:position + token_bytes].decode('utf-8').split('\n') if token_count else []
+        except UnicodeDecodeError:
+            return False
+        counts.frombytes(data[position + token_bytes:counts_end])
+        line_indices = array('I')
+        if len(tokens) != token_count or len(data) - counts_end != line_indices.itemsize * sum(counts):
+            return False
+        line_indices.frombytes(data[counts_end:])
+        start = 0
+        for token, count in zip(tokens, counts):
+            self._postings[token] = line_indices[start:start + count]
+            start += count
+        return True
+
+    def _build(self):
+        postings = self._postings
+        for line_index in range(len(self.lines)):
+            for token in set(tokenize(self.lines[line_index])):
+                line_indices = postings.get(token)
+                if line_indices is None:
+                    line_indices = postings[token] = array('I')
+                line_indices.append(line_index)
+
+    def _save(self):
+        """Writes the header, the tokens joined by newlines, each token's posting count, then the postings."""
+        tokens = list(self._postings)
+        token_data = '\n'.join(tokens).encode('utf-8')  # Tokens are \w+, so never contain a newline
+        counts = array('I', (len(self._postings[token]) for token in tokens))
+        try:
+            with open(self.cache_path, 'wb') as f:
+                f.write(SEARCH_INDEX_HEADER.pack(SEARCH_INDEX_MAGIC, *self._source_stamp(), len(tokens),
+                                                 len(token_data)))
+                f.write(token_data)
+                f.write(counts.tobytes())
+                for token in tokens:
+                    f.write(self._postings[token].tobytes())
+        except OSError as e:
+            print(f"Warning: Could not cache search index {self.cache_path}: {e}")
+
+    def _prefix_postings(self, prefix):
+        start = bisect_left(self._tokens, prefix)
+        for token in self._tokens[start:]:
+            if not token.startswith(prefix):
+                break
+            yield self._postings[token]
+
+    def submit(self, query):
+        """Runs search(query) on the index thread once the index is ready; poll() returns the result."""
+        self._generation += 1
+        self._queries.put((query, self._generation))
+
+    def poll(self):
+        """(query, search(query)) once the latest submitted query has finished, else None."""
+        result = self._result
+        if result is None or result[0] != self._generation:
+            return None
+        self._result = None
+        return result[1:]
+
+    def search(self, query):
+        """Returns the ascending line indices matching query, [] for no match, or None if not ready/empty query."""
+        if not self.ready:
+            return None
+        words = tokenize(query)
+        if not words:
+            return None
+        complete_words, prefix = words[:-1], words[-1]
+        if query[-1:].isspace():  # The last word has been finished too
+            complete_words, prefix = words, None
+        if prefix is None and len(set(complete_words)) == 1:
+            return list(self._postings.get(complete_words[0], ()))  # One posting array is the answer as it is
+
+        candidates = None
+        for word in sorted(set(complete_words), key=lambda w: len(self._postings.get(w, ()))):
+            line_indices = self._postings.get(word)
+            if line_indices is None:
+                return []
+            candidates = set(line_indices) if candidates is None else candidates.intersection(line_indices)
+            if not candidates:
+                return []
+
+        if prefix is not None:
+            prefix_postings = list(self._prefix_postings(prefix))
+            if not prefix_postings:
+                return []
+            if candidates is None and len(prefix_postings) == 1:
+                return list(prefix_postings[0])
+            matches = set()
+            for line_indices in prefix_postings:
+                matches.update(line_indices)
+            candidates = matches if candidates is None else candidates & matches
+        if len(candidates) > len(self.lines) // 4:
+            # Dense: one pass over the line numbers comes out sorted, and unlike one big sorted() call it lets
+            # the frame loop have the GIL in between
+            return [line_index for line_index in range(len(self.lines)) if line_index in candidates]
+        return sorted(candidates)
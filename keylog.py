@@ -0,0 +1,131 @@
+import struct
+import sys
+import time
+import zlib
+from array import array
+
+KEYLOG_MAGIC = b'TSMK'
+KEYLOG_VERSION = 1
+# magic, version, flags (unused), keystroke count, UTF-8 length of the target text
+KEYLOG_HEADER = struct.Struct('<4sBBII')
+KEYLOG_MIN_CAPACITY = 256
+
+# Bits of a keystroke's flags column
+CORRECT = 1  # Typed character matched the target
+BACKSPACE = 2  # Deleted the character at target_index
+FINISH = 4  # Enter pressed; the test ended here
+
+
+class KeystrokeLog:
+    """Every keystroke of one typing test in preallocated, array-backed columns.
+
+    Columns, one entry per keystroke:
+        codepoints      typed character (8 for backspace, 13 for the finishing Enter)
+        target_indices  position in the target text the keystroke applied to
+        flags           CORRECT / BACKSPACE / FINISH bits
+        timestamps      perf_counter_ns since start()
+    """
+
+    def __init__(self, text="", capacity=KEYLOG_MIN_CAPACITY):
+        self.text = text
+        self.count = 0
+        self._start_ns = 0
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        self.capacity = capacity
+        self.codepoints = array('I', bytes(4 * capacity))
+        self.target_indices = array('I', bytes(4 * capacity))
+        self.flags = array('B', bytes(capacity))
+        self.timestamps = array('q', bytes(8 * capacity))
+
+    def reset(self, text):
+        """Empties the log for a test on text, sized so an ordinary run never has to grow it."""
+        self.text = text
+        self.count = 0
+        self._start_ns = 0
+        capacity = max(KEYLOG_MIN_CAPACITY, 2 * len(text))
+        if capacity > self.capacity:
+            self._allocate(capacity)
+
+    def start(self):
+        """Marks t=0, the moment typing begins."""
+        self._start_ns = time.perf_counter_ns()
+
+    def elapsed_ns(self):
+        """Time since start() on the clock the timestamps use."""
+        return time.perf_counter_ns() - self._start_ns
+
+    def _grow(self):
+        for column in (self.codepoints, self.target_indices, self.flags, self.timestamps):
+            column.extend(array(column.typecode, bytes(column.itemsize * self.capacity)))
+        self.capacity *= 2
+
+    def record(self, codepoint, target_index, flags):
+        i = self.count
+        if i == self.capacity:
+            self._grow()
+        self.codepoints[i] = codepoint
+        self.target_indices[i] = target_index
+        self.flags[i] = flags
+        self.timestamps[i] = time.perf_counter_ns() - self._start_ns
+        self.count = i + 1
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        """Yields (codepoint, target_index, flags, timestamp_ns) in the order they were typed."""
+        for i in range(self.count):
+            yield self.codepoints[i], self.target_indices[i], self.flags[i], self.timestamps[i]
+
+    def to_bytes(self):
+        """Compact binary form: a small header, the target text, then the zlib-compressed columns.
+
+        Timestamps are stored as deltas from the previous keystroke, which compress far better.
+        """
+        n = self.count
+        deltas = array('q', bytes(8 * n))
+        previous = 0
+        for i in range(n):
+            deltas[i] = self.timestamps[i] - previous
+            previous = self.timestamps[i]
+        columns = [self.codepoints[:n], self.target_indices[:n], self.flags[:n], deltas]
+        if sys.byteorder != 'little':
+            for column in columns:
+                column.byteswap()
+        text = self.text.encode('utf-8')
+        body = zlib.compress(b''.join(column.tobytes() for column in columns))
+        return KEYLOG_HEADER.pack(KEYLOG_MAGIC, KEYLOG_VERSION, 0, n, len(text)) + text + body
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Inverse of to_bytes. Raises ValueError if data is not a keystroke log."""
+        if len(data) < KEYLOG_HEADER.size:
+            raise ValueError("keystroke log is truncated")
+        magic, version, _, n, text_length = KEYLOG_HEADER.unpack_from(data)
+        if magic != KEYLOG_MAGIC or version != KEYLOG_VERSION:
+            raise ValueError("not a keystroke log, or an unsupported version")
+        offset = KEYLOG_HEADER.size
+        text = bytes(data[offset:offset + text_length]).decode('utf-8')
+        try:
+            body = zlib.decompress(data[offset + text_length:])
+        except zlib.error as e:
+            raise ValueError(f"corrupt keystroke log: {e}")
+        if len(body) != n * 17:  # 4 + 4 + 1 + 8 bytes per keystroke
+            raise ValueError("keystroke log length does not match its header")
+
+        log = cls(text, max(n, 1))
+        log.count = n
+        position = 0
+        for column in (log.codepoints, log.target_indices, log.flags, log.timestamps):
+            size = n * column.itemsize
+            column[:n] = array(column.typecode, body[position:position + size])
+            if sys.byteorder != 'little':
+                column.byteswap()
+            position += size
+        elapsed = 0
+        for i in range(n):  # Deltas back to offsets from start()
+            elapsed += log.timestamps[i]
+            log.timestamps[i] = elapsed
+        return log
@@ -0,0 +1,105 @@
+import struct
+import sys
+import zlib
+from array import array
+
+from keylog import BACKSPACE, FINISH
+
+FIRST_CODEPOINT = 32  # Printable ASCII only; other characters aren't tracked
+ALPHABET_SIZE = 95
+MAX_INTERVAL_NS = 2_000_000_000  # Longer gaps are pauses, not typing speed
+MIN_SAMPLES = 3  # Keys and bigrams with fewer intervals are left out of colour scales and rankings
+
+LATENCY_MAGIC = b'TSML'
+LATENCY_VERSION = 1
+LATENCY_HEADER = struct.Struct('<4sBxH')  # magic, version, alphabet size
+
+
+def key_index(char):
+    """Slot of char in the latency arrays (letters are case-insensitive), or -1 if it isn't tracked."""
+    index = ord(char.lower()) - FIRST_CODEPOINT
+    return index if 0 <= index < ALPHABET_SIZE else -1
+
+
+class KeyLatency:
+    """Cumulative inter-key intervals per key and per bigram, in fixed-size count/total arrays.
+
+    The interval before a keystroke is charged to the key pressed and to the (previous key, key) bigram, so
+    recording is a handful of array updates however much history a user has.
+    """
+
+    def __init__(self):
+        self.key_counts = array('I', bytes(4 * ALPHABET_SIZE))
+        self.key_totals = array('Q', bytes(8 * ALPHABET_SIZE))  # Nanoseconds
+        self.bigram_counts = array('I', bytes(4 * ALPHABET_SIZE * ALPHABET_SIZE))  # [previous * size + key]
+        self.bigram_totals = array('Q', bytes(8 * ALPHABET_SIZE * ALPHABET_SIZE))
+
+    def record(self, previous_char, char, interval_ns):
+        if not 0 < interval_ns <= MAX_INTERVAL_NS:
+            return
+        key = key_index(char)
+        if key < 0:
+            return
+        self.key_counts[key] += 1
+        self.key_totals[key] += interval_ns
+        previous = key_index(previous_char)
+        if previous >= 0:
+            bigram = previous * ALPHABET_SIZE + key
+            self.bigram_counts[bigram] += 1
+            self.bigram_totals[bigram] += interval_ns
+
+    def record_from_log(self, log):
+        """Records the interval before the log's latest keystroke if it and the one before were typed characters."""
+        i = log.count - 1
+        if i < 1 or (log.flags[i] | log.flags[i - 1]) & (BACKSPACE | FINISH):
+            return
+        self.record(chr(log.codepoints[i - 1]), chr(log.codepoints[i]), log.timestamps[i] - log.timestamps[i - 1])
+
+    def key_means_ms(self):
+        """{char: mean interval in ms} for every key with at least MIN_SAMPLES intervals."""
+        return {chr(FIRST_CODEPOINT + i): self.key_totals[i] / count / 1e6
+                for i, count in enumerate(self.key_counts) if count >= MIN_SAMPLES}
+
+    def slowest_bigrams(self, limit):
+        """[(bigram, mean interval in ms)] of the slowest bigrams with at least MIN_SAMPLES intervals."""
+        means = [(self.bigram_totals[i] / count, i) for i, count in enumerate(self.bigram_counts)
+                 if count >= MIN_SAMPLES]
+        means.sort(reverse=True)
+        return [(chr(FIRST_CODEPOINT + i // ALPHABET_SIZE) + chr(FIRST_CODEPOINT + i % ALPHABET_SIZE), mean / 1e6)
+                for mean, i in means[:limit]]
+
+    def _columns(self):
+        return self.key_counts, self.key_totals, self.bigram_counts, self.bigram_totals
+
+    def to_bytes(self):
+        columns = [array(column.typecode, column) for column in self._columns()]
+        if sys.byteorder != 'little':
+            for column in columns:
+                column.byteswap()
+        # The bigram arrays are mostly zeros, so they compress to a few kilobytes
+        return LATENCY_HEADER.pack(LATENCY_MAGIC, LATENCY_VERSION, ALPHABET_SIZE) + \
+            zlib.compress(b''.join(column.tobytes() for column in columns))
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Inverse of to_bytes. Raises ValueError if data doesn't hold latency arrays of this layout."""
+        if len(data) < LATENCY_HEADER.size:
+            raise ValueError("latency data is truncated")
+        magic, version, size = LATENCY_HEADER.unpack_from(data)
+        if magic != LATENCY_MAGIC or version != LATENCY_VERSION or size != ALPHABET_SIZE:
+            raise ValueError("not latency data, or an unsupported version")
+        try:
+            body = zlib.decompress(data[LATENCY_HEADER.size:])
+        except zlib.error as e:
+            raise ValueError(f"corrupt latency data: {e}")
+        stats = cls()
+        if len(body) != sum(column.itemsize * len(column) for column in stats._columns()):
+            raise ValueError("latency data has the wrong size")
+        position = 0
+        for column in stats._columns():
+            length = column.itemsize * len(column)
+            column[:] = array(column.typecode, body[position:position + length])
+            if sys.byteorder != 'little':
+                column.byteswap()
+            position += length
+        return stats
@@ -0,0 +1,80 @@
+import heapq
+import itertools
+from collections import OrderedDict
+
+LEADERBOARD_SIZE = 10  # Sessions shown per board
+MAX_CACHED_BOARDS = 64  # Per-paragraph and per-day boards kept in memory (each)
+
+
+class TopK:
+    """The k fastest sessions seen so far, kept in a min-heap so each add is O(log k)."""
+
+    def __init__(self, k, sessions=()):
+        self.k = k
+        self._heap = []  # (wpm, -arrival, session); the slowest, then the newest, is evicted first
+        self._arrivals = itertools.count()
+        for session in sessions:
+            self.add(session)
+
+    def add(self, session):
+        item = (session["wpm"], -next(self._arrivals), session)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, item)
+        elif item[:2] > self._heap[0][:2]:
+            heapq.heapreplace(self._heap, item)
+
+    def ranked(self):
+        """Sessions fastest first."""
+        return [item[2] for item in sorted(self._heap, key=lambda item: item[:2], reverse=True)]
+
+    def __len__(self):
+        return len(self._heap)
+
+
+class Leaderboard:
+    """Overall, per-paragraph and per-day top-K boards across all users.
+
+    Each board is seeded once from the store's indexed top_sessions query the first time it is shown,
+    then kept current by record_session, so showing it never rescans anyone's history.
+    """
+
+    def __init__(self, store, k=LEADERBOARD_SIZE, max_cached_boards=MAX_CACHED_BOARDS):
+        self.store = store
+        self.k = k
+        self.max_cached_boards = max_cached_boards
+        self._overall = None
+        self._by_paragraph = OrderedDict()  # {paragraph snippet: TopK}
+        self._by_day = OrderedDict()  # {"YYYY-MM-DD": TopK}
+
+    def _board(self, boards, key, **query):
+        board = boards.get(key)
+        if board is None:
+            board = boards[key] = TopK(self.k, self.store.top_sessions(self.k, **query))
+            if len(boards) > self.max_cached_boards:
+                boards.popitem(last=False)
+        else:
+            boards.move_to_end(key)
+        return board
+
+    def top_overall(self):
+        if self._overall is None:
+            self._overall = TopK(self.k, self.store.top_sessions(self.k))
+        return self._overall.ranked()
+
+    def top_for_paragraph(self, paragraph):
+        return self._board(self._by_paragraph, paragraph, paragraph=paragraph).ranked()
+
+    def top_for_day(self, day):
+        return self._board(self._by_day, day, day=day).ranked()
+
+    def record_session(self, username, session):
+        """Adds a just-finished session to every board that is already loaded; O(log k) each."""
+        entry = dict(session, username=username)
+        if self._overall is not None:
+            self._overall.add(entry)
+        board = self._by_paragraph.get(session["paragraph"])
+        if board is not None:
+            board.add(entry)
+        board = self._by_day.get(session["date"][:10])
+        if board is not None:
+            board.add(entry)
@@ -1,10 +1,26 @@
 import pygame
-from pygame.locals import *
+from pygame.locals import (K_BACKSPACE, K_DOWN, K_ESCAPE, K_F2, K_F3, K_PAGEDOWN, K_PAGEUP, K_RETURN, K_UP, KEYDOWN,
+                           MOUSEBUTTONDOWN, MOUSEMOTION, MOUSEWHEEL, QUIT, SRCALPHA, VIDEOEXPOSE)
+import argparse
 import sys
 import time
 import random
 import os
-import json  # New: for saving/loading user data
+from bisect import bisect_right
+from collections import OrderedDict
+
+from alignment import BandedAlignment
+from assets import AssetManager
+from audio import AUDIO_BUFFER, AudioEngine
+from analytics import ROLLING_WINDOW, UserAnalytics, graph_points, numpy_available
+from corpus import LineCorpus, SearchIndex
+from keylog import BACKSPACE, CORRECT, FINISH, KeystrokeLog
+from latency import KeyLatency
+from leaderboard import Leaderboard
+from profiler import FrameProfiler, percentile
+from replay import Replay
+from storage import PersistenceWorker, ProfileCache, open_user_store, paragraph_snippet
+from timeline import WpmTimeline, lttb
 
 SCREEN_WIDTH = 1000  # Increased width for more UI elements
 SCREEN_HEIGHT = 700  # Increased height
@@ -57,22 +73,50 @@ PARAGRAPH_SELECT = 3
 COUNTDOWN = 4
 USER_SELECT = 5  # New state for user management
 CREATE_USER = 6  # New state for creating a new user
+LEADERBOARD = 7
+STATS = 8  # Progress analytics of the current user
+# Drawn from a pre-composited surface
+STATIC_SCREENS = (MENU, PARAGRAPH_SELECT, USER_SELECT, RESULTS, LEADERBOARD, STATS)
+
+LEADERBOARD_VIEWS = {"overall": "Overall", "paragraph": "This Paragraph", "today": "Today"}
 
 ASSETS_DIR = 'assets'
-AUDIO_DIR = os.path.join(ASSETS_DIR, 'audio')
+AUDIO_DIR = os.path.join(ASSETS_DIR, 'audio')  # Resolved case-insensitively, see assets.resolve_path
+ASSET_CACHE_DIR = 'asset_cache'  # Pre-scaled, display-format images from earlier launches
+SOUND_FILES = {  # Sound name: (file in AUDIO_DIR, volume, audio.CHANNEL_POOLS pool or None)
+    "key_press": ('key_press.wav', 0.3, "key"),
+    "error": ('error.wav', 1.0, "error"),
+    "game_start": ('game_start.wav', 1.0, None),
+    "game_complete": ('game_complete.wav', 1.0, None),
+}
 SENTENCES_FILE = 'sentences.txt'
 USERS_FILE = 'users.json'  # New: File to store user data
+USERS_DB_FILE = 'users.db'
+STORAGE_BACKEND = "sqlite"  # "sqlite" (users.db, imports users.json once) or "json" (legacy users.json only)
+FSYNC_POLICY = "file"  # "always", "file" or "never"; see storage.FSYNC_POLICIES
 
 INPUT_BOX_WIDTH = 700
 INPUT_BOX_HEIGHT = 100
 INPUT_BOX_X = (SCREEN_WIDTH - INPUT_BOX_WIDTH) // 2
 INPUT_BOX_Y = SCREEN_HEIGHT // 2 - 50
 
+# Target paragraph viewport: passages longer than this many lines scroll to keep up with the cursor
+PARAGRAPH_VIEW_Y = 120
+PARAGRAPH_VIEW_LINES = 5
+PARAGRAPH_LEAD_LINES = 1  # Typed lines kept in view above the cursor line
+PARAGRAPH_WRAP_AHEAD = 2  # Lines wrapped past the viewport, so scrolling to them needs no layout work
+
 PROGRESS_BAR_WIDTH = 600
 PROGRESS_BAR_HEIGHT = 20
 PROGRESS_BAR_X = (SCREEN_WIDTH - PROGRESS_BAR_WIDTH) // 2
 PROGRESS_BAR_Y = SCREEN_HEIGHT - 120
 
+# Paragraph picker: a search box, then a scrolling list that only materialises the rows on screen
+PICKER_SEARCH_RECT = (SCREEN_WIDTH // 2 - 300, 80, 600, 40)
+PICKER_LIST_Y = 160
+PICKER_ROW_HEIGHT = 45
+PICKER_ROW_SPACING = 55
+
 KEYBOARD_LAYOUT = [
     "`1234567890-=",
     "qwertyuiop[]\\",
@@ -85,27 +129,73 @@ KEYBOARD_LAYOUT = [
 KEY_WIDTH = 40
 KEY_HEIGHT = 40
 KEY_MARGIN = 5
+HEATMAP_MODES = {"errors": "Errors", "latency": "Latency"}  # What the on-screen keyboard colours keys by
+HEATMAP_HOTKEY = K_F2  # Switches between the heatmap modes
+HEATMAP_PERCENTILES = (0.5, 0.9)  # Keys above these percentiles of the mode's values are medium / high
+SLOWEST_BIGRAMS_SHOWN = 3  # On the results screen
+
+# Redraw only changed regions and push them with display.update(rects) instead of flipping every frame
+DIRTY_RECT_RENDERING = True
+
+GLYPH_CACHE_SIZE = 1024  # Max cached (font, char, colour) surfaces before LRU eviction
+LABEL_CACHE_SIZE = 256  # Max cached rendered button/heading labels
+
+PROFILER_HOTKEY = K_F3  # Shows/hides the profiler overlay
+PROFILE_SUMMARY_FILE = 'profile_summary.json'  # Written on exit when profiling
+
+_font_pool = {}  # {size: pygame.font.Font}, shared by the game and every Button
+_START_NS = time.perf_counter_ns()
+
+
+def ticks_ms():
+    """Milliseconds since startup, like pygame.time.get_ticks(), which needs pygame.init()'s timer."""
+    return (time.perf_counter_ns() - _START_NS) // 1_000_000
+
+
+def get_font(size):
+    """Returns the shared default font at the given size, creating it (and the font module) on first use."""
+    font = _font_pool.get(size)
+    if font is None:
+        if not pygame.font.get_init():
+            pygame.font.init()
+        font = _font_pool[size] = pygame.font.Font(None, size)
+    return font
 
 
+class FontAttribute:
+    """Game.font_* attributes: the shared font of one size, looked up on access so it is only created once a
+    screen actually draws with it."""
+
+    def __init__(self, size):
+        self.size = size
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self  # Game.font_sm.size gives a size without creating the font
+        return get_font(self.size)
+
 
 class Button:
     def __init__(self, x, y, width, height, text, font_size, color_name, hover_color_name, text_color_name,
                  game_instance):
         self.rect = pygame.Rect(x, y, width, height)
         self.text = text
-        self.font = pygame.font.Font(None, font_size)
+        self.font_size = font_size  # The font itself is created on first draw, see get_font
         self.color_name = color_name
         self.hover_color_name = hover_color_name
         self.text_color_name = text_color_name
         self.is_hovered = False
         self.game = game_instance  # Reference to game instance for theme colors
 
-    def draw(self, screen):
+    def draw(self, screen, hovered=None):
+        if hovered is None:
+            hovered = self.is_hovered
         current_theme_colors = self.game.current_theme_colors
-        current_color = current_theme_colors[self.hover_color_name] if self.is_hovered else current_theme_colors[
+        current_color = current_theme_colors[self.hover_color_name] if hovered else current_theme_colors[
             self.color_name]
         pygame.draw.rect(screen, current_color, self.rect, border_radius=8)
-        text_surface = self.font.render(self.text, True, current_theme_colors[self.text_color_name])
+        text_surface = self.game.label_cache.get(get_font(self.font_size), self.text,
+                                                 current_theme_colors[self.text_color_name])
         text_rect = text_surface.get_rect(center=self.rect.center)
         screen.blit(text_surface, text_rect)
 
@@ -118,38 +208,314 @@ class Button:
         return False
 
 
+class ScoringEngine:
+    """Keeps correct/incorrect/extra/missing counters up to date in O(1) per keystroke."""
+    # Per-position outcome codes stored in self._outcomes
+    INCORRECT = 0
+    CORRECT = 1
+    EXTRA = 2  # Typed beyond the end of the target
+
+    def __init__(self, target=""):
+        self.reset(target)
+
+    def reset(self, target):
+        self.target = target
+        self.target_length = len(target)
+        self.correct = 0
+        self.incorrect = 0
+        self.extra = 0
+        self._outcomes = bytearray()  # One outcome code per typed character, so backspace can undo it
+
+    @property
+    def typed_count(self):
+        return len(self._outcomes)
+
+    @property
+    def missing(self):
+        return max(0, self.target_length - len(self._outcomes))
+
+    @property
+    def errors(self):
+        """Mismatched, extra and not-yet-typed characters, same as the old full-text rescan."""
+        return self.incorrect + self.extra + self.missing
+
+    @property
+    def accuracy(self):
+        typed = len(self._outcomes)
+        return (self.correct / typed) * 100 if typed > 0 else 0.0
+
+    def next_target_char(self):
+        """Returns the target character at the cursor, or '' once past the end."""
+        pos = len(self._outcomes)
+        return self.target[pos] if pos < self.target_length else ''
+
+    def push(self, typed_char):
+        """Records one typed character. Returns True if it matched the target."""
+        pos = len(self._outcomes)
+        if pos >= self.target_length:
+            self._outcomes.append(self.EXTRA)
+            self.extra += 1
+            return False
+        if typed_char == self.target[pos]:
+            self._outcomes.append(self.CORRECT)
+            self.correct += 1
+            return True
+        self._outcomes.append(self.INCORRECT)
+        self.incorrect += 1
+        return False
+
+    def pop(self):
+        """Undoes the last typed character (backspace). Returns its outcome code, or None if empty."""
+        if not self._outcomes:
+            return None
+        outcome = self._outcomes.pop()
+        if outcome == self.CORRECT:
+            self.correct -= 1
+        elif outcome == self.INCORRECT:
+            self.incorrect -= 1
+        else:
+            self.extra -= 1
+        return outcome
+
+    def is_correct_at(self, index):
+        """Whether the character typed at index matched the target (index must be < typed_count)."""
+        return self._outcomes[index] == self.CORRECT
+
+    def wpm(self, elapsed_seconds):
+        if elapsed_seconds <= 0:
+            return 0
+        return (len(self._outcomes) / 5) / (elapsed_seconds / 60)
+
+
+class GlyphCache:
+    """Bounded LRU cache of rendered text surfaces keyed by (font, text, colour); mostly single glyphs."""
+
+    def __init__(self, max_size=GLYPH_CACHE_SIZE):
+        self.max_size = max_size
+        self._surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, font, char, color):
+        key = (font, char, color)
+        surface = self._surfaces.get(key)
+        if surface is not None:
+            self._surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+        self.misses += 1
+        surface = font.render(char, True, color)
+        self._surfaces[key] = surface
+        if len(self._surfaces) > self.max_size:
+            self._surfaces.popitem(last=False)
+            self.evictions += 1
+        return surface
+
+    def clear(self):
+        """Drops all cached surfaces (e.g. on theme change). Counters are kept."""
+        self._surfaces.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._surfaces),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+        }
+
+
+class InputBuffer:
+    """Typed text as a list of characters plus a running pixel-width prefix; append and pop are O(1)."""
+
+    def __init__(self, font_size):
+        self.font_size = font_size  # The font is looked up when the first new glyph is measured, see get_font
+        self._chars = []
+        self._prefix_widths = [0]  # _prefix_widths[i] is the pixel width of the first i characters
+        self._glyph_widths = {}
+
+    def __len__(self):
+        return len(self._chars)
+
+    @property
+    def width(self):
+        return self._prefix_widths[-1]
+
+    def clear(self):
+        self._chars.clear()
+        del self._prefix_widths[1:]
+
+    def append(self, char):
+        width = self._glyph_widths.get(char)
+        if width is None:
+            width = self._glyph_widths[char] = get_font(self.font_size).size(char)[0]
+        self._chars.append(char)
+        self._prefix_widths.append(self._prefix_widths[-1] + width)
+
+    def pop(self):
+        if not self._chars:
+            return None
+        self._prefix_widths.pop()
+        return self._chars.pop()
+
+    def offset_of(self, index):
+        """Pixel x of character index relative to the start of the text."""
+        return self._prefix_widths[index]
+
+    def index_at(self, x):
+        """Index of the character covering pixel x (clamped to the text)."""
+        return max(0, min(len(self._chars), bisect_right(self._prefix_widths, x) - 1))
+
+    def slice(self, start, end=None):
+        return ''.join(self._chars[start:end])
+
+
+class ParagraphLayout:
+    """Wrapped lines and per-character x positions of a paragraph for one (text, font, box width).
+
+    Lines are wrapped on demand, only as far as the viewport has needed, so a chapter-length passage costs
+    nothing up front and text far below the visible lines is never measured. Line y positions are relative
+    to the first line; the viewport places them on screen.
+    """
+
+    def __init__(self, text, font, max_width, origin_x, line_spacing_factor=1.2):
+        self.key = (text, font, max_width)
+        self.text = text
+        self.font = font
+        self.max_width = max_width
+        self.origin_x = origin_x
+        self.line_height = font.get_linesize() * line_spacing_factor
+        self.lines = []  # (start, end) index ranges into text; the space a line breaks on belongs to no line
+        self.line_widths = []
+        self._line_starts = []  # lines[i][0], for bisecting
+        self.xs = []  # Top-left x of each character index wrapped so far
+        self.widths = []
+        self._glyph_widths = {}
+        self._space_width = self._char_width(' ')
+        self._next_line_start = 0 if text else None  # None once the whole text is wrapped
+
+    @property
+    def complete(self):
+        return self._next_line_start is None
+
+    def _char_width(self, char):
+        width = self._glyph_widths.get(char)
+        if width is None:
+            width = self._glyph_widths[char] = self.font.size(char)[0]
+        return width
+
+    def _wrap_line(self):
+        """Wraps the next line. Greedy word wrap on ' ', like _wrap_text, but summing cached glyph widths."""
+        text = self.text
+        line_start = self._next_line_start
+        line_end = len(text)
+        line_width = 0
+        word_start = line_start
+        while word_start <= len(text):
+            word_end = text.find(' ', word_start)
+            if word_end == -1:
+                word_end = len(text)
+            word_width = sum(self._char_width(char) for char in text[word_start:word_end])
+            if word_start > line_start and line_width + self._space_width + word_width > self.max_width:
+                line_end = word_start - 1  # Break on the preceding space
+                break
+            if word_start > line_start:
+                line_width += self._space_width + word_width
+            else:
+                line_width = word_width
+            word_start = word_end + 1
+
+        x = self.origin_x + (self.max_width - line_width) // 2
+        for i in range(line_start, line_end):
+            width = self._char_width(text[i])
+            self.xs.append(x)
+            self.widths.append(width)
+            x += width
+        if line_end < len(text):  # The break space sits just past the end of its line
+            self.xs.append(x)
+            self.widths.append(self._space_width)
+        self.lines.append((line_start, line_end))
+        self.line_widths.append(line_width)
+        self._line_starts.append(line_start)
+        self._next_line_start = line_end + 1 if line_end < len(text) else None
+
+    def wrap_lines(self, count):
+        """Makes sure the first count lines (or all of them, if there are fewer) are wrapped."""
+        while len(self.lines) < count and not self.complete:
+            self._wrap_line()
+
+    def matches(self, text, font, max_width):
+        return self.key[1] is font and self.key[2] == max_width and self.key[0] == text
+
+    def line_y(self, line):
+        """Top of a line relative to the top of the first one."""
+        return int(line * self.line_height)
+
+    def line_of(self, index):
+        """Index of the wrapped line containing character index, wrapping up to it if needed."""
+        while len(self.xs) <= index and not self.complete:
+            self._wrap_line()
+        return max(0, bisect_right(self._line_starts, index) - 1)
+
 
 class Game:
-    def __init__(self):
-        pygame.init()
-        pygame.mixer.init()
+    font_lg = FontAttribute(74)
+    font_md = FontAttribute(48)
+    font_sm = FontAttribute(36)
+    font_xs = FontAttribute(24)
+    font_key = FontAttribute(20)  # Font for keyboard keys
+
+    def __init__(self, profile=False):
+        self._init_start_ns = time.perf_counter_ns()
+        self.window_ms = None  # Time from here until the window was open
+        self.first_frame_ms = None  # Time from here to the first frame on screen, reported by _shutdown
+        self.assets_ready_ms = None  # Time from here until every asset was swapped in
+        # Only the display is needed for the first frame; fonts start with the first get_font() and the mixer
+        # once that frame is up (see _start_assets)
+        pygame.display.init()
 
         self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
         pygame.display.set_caption('Typing Speed Master')
+        self.window_ms = (time.perf_counter_ns() - self._init_start_ns) / 1e6
 
-        self.font_lg = pygame.font.Font(None, 74)
-        self.font_md = pygame.font.Font(None, 48)
-        self.font_sm = pygame.font.Font(None, 36)
-        self.font_xs = pygame.font.Font(None, 24)
-        self.font_key = pygame.font.Font(None, 20)  # Font for keyboard keys
+        self.label_cache = GlyphCache(LABEL_CACHE_SIZE)  # Rendered labels; Buttons draw through it
 
         self.current_state = MENU
 
         self.current_theme_name = DEFAULT_THEME
         self.current_theme_colors = THEMES[DEFAULT_THEME]
 
-        self.users_data = self._load_users_data()
+        self.persistence = PersistenceWorker()  # Saves run here so finishing a test never waits on the disk
+        self.user_store = open_user_store(STORAGE_BACKEND, USERS_FILE, USERS_DB_FILE, self.persistence, FSYNC_POLICY)
+        self.user_index = self.user_store.load_index()  # {username: {'high_wpm', 'low_wpm'}}, no history
+        self.profile_cache = ProfileCache(self.user_store)  # Histories of recently selected users
+        self.leaderboard = Leaderboard(self.user_store)
+        self.leaderboard_view = "overall"
+        self.leaderboard_rows = []
+        self.analytics = UserAnalytics()  # Per-user stats, recomputed only after a new session
+        self.user_stats = None  # Stats shown on the STATS screen
         self.current_user = None  # No user selected initially
+        self.high_wpm = 0
+        self.low_wpm = float('inf')
         self.new_user_input = ""  # For user creation
         self.user_input_active = False  # For user creation input box
 
-        self.input_text = ""
+        self.input_buffer = InputBuffer(Game.font_sm.size)  # What the player has typed so far
         self.target_paragraph = ""
         self.time_start = 0
         self.total_time = 0
         self.errors = 0
         self.wpm = 0
         self.accuracy = 0.0
+        self.scoring = ScoringEngine()  # Incremental counters fed by _handle_events
+        self.alignment = BandedAlignment()  # Edit-distance alignment behind detailed_errors, one row per typed char
+        self.keystroke_log = KeystrokeLog()  # Every keystroke of the current test, saved with the session
+        self.last_keylog = None  # Serialised log of the last finished test, for "Watch Replay"
+        self.replay = None  # Replay feeding recorded keystrokes into TYPING instead of the keyboard
+
+        self._input_surface_cache = (None, None)  # (key, surface) of the rendered visible input tail
 
         self.cursor_visible = True
         self.cursor_timer = 0
@@ -160,15 +526,21 @@ class Game:
         self.countdown_number = 3
         self.countdown_start_time = 0
 
-        self.wpm_history = []  # Stores (timestamp, wpm) pairs during typing
+        self.wpm_timeline = WpmTimeline()  # (time_ms, wpm) samples during typing, bounded however long the test
+        self._wpm_graph_cache = (None, None)  # (key, surface) of the results screen's WPM graph
         self.error_char_map = {}  # Tracks errors per character {char: count}
-        self.last_typed_char_pos = 0  # To calculate omissions/insertions
         self.detailed_errors = {'insertions': 0, 'omissions': 0, 'substitutions': 0}
         self.key_heatmap_data = {}  # {key_char: error_count} for keyboard visualizer
+        self.key_latency = KeyLatency()  # Current user's cumulative inter-key intervals, saved after each test
+        self.heatmap_mode = "errors"
+        self._heatmap_values = {}  # {key_char: value} the keyboard is currently coloured by
+        self._heatmap_scale = None  # (medium, high) thresholds from HEATMAP_PERCENTILES of _heatmap_values
         self.current_key_to_press = ''  # For on-screen keyboard highlighting
 
+        self.paragraph_layout = None  # ParagraphLayout of target_paragraph, see _get_paragraph_layout
         self.paragraphs = self._load_paragraphs()
-        self.selected_paragraph_index = 0
+        self.selected_paragraph_index = self._random_paragraph_index()  # Start on a random paragraph
+        self.passage = None  # Long-text mode: a whole text file typed instead of the selected paragraph
         if self.paragraphs:
             self.target_paragraph = self.paragraphs[self.selected_paragraph_index]
         else:
@@ -183,7 +555,17 @@ class Game:
                                               "FOREGROUND", self)
         self.back_to_menu_button = Button(SCREEN_WIDTH // 2 - 100, SCREEN_HEIGHT - 70, 200, 50, "Back to Menu", 35,
                                           "SECONDARY", "HIGHLIGHT", "FOREGROUND", self)
-        self.paragraph_buttons = []
+        self.replay_button = Button(60, SCREEN_HEIGHT - 100, 200, 50, "Watch Replay", 35, "SECONDARY", "HIGHLIGHT",
+                                    "FOREGROUND", self)
+        self.paragraph_buttons = []  # Visible picker rows (a prefix of paragraph_row_pool)
+        self.paragraph_row_pool = []  # One reusable Button per on-screen picker row
+        self._paragraph_row_indices = []  # Paragraph index shown by each visible row
+        self.paragraph_query = ""
+        self.paragraph_results = None  # Sorted matching paragraph indices, or None for "all paragraphs"
+        self.paragraph_scroll = 0  # Position in the matches of the first visible row
+        self.picker_revision = 0  # Bumped whenever the visible rows change
+        self.search_index = None  # Built in the background when the picker is first opened
+        self._search_pending = False  # A query is waiting on the search index thread, see _poll_paragraph_search
 
         self.manage_users_button = Button(SCREEN_WIDTH // 2 - 120, SCREEN_HEIGHT // 2 + 240, 240, 60, "Manage Users",
                                           40, "PRIMARY_ACCENT", "SECONDARY_ACCENT", "FOREGROUND", self)
@@ -193,58 +575,86 @@ class Game:
                                          "SECONDARY_ACCENT", "PRIMARY_ACCENT", "FOREGROUND", self)
         self.theme_toggle_button = Button(SCREEN_WIDTH - 150, 20, 120, 40, "Toggle Theme", 28, "SECONDARY", "HIGHLIGHT",
                                           "FOREGROUND", self)  # New button for theme
+        self.leaderboard_button = Button(30, 20, 150, 40, "Leaderboard", 28, "SECONDARY", "HIGHLIGHT", "FOREGROUND",
+                                         self)
+        self.stats_button = Button(30, 70, 150, 40, "My Stats", 28, "SECONDARY", "HIGHLIGHT", "FOREGROUND", self)
+        self.leaderboard_tab_buttons = {}  # Created when the leaderboard is first shown
 
         self.user_selection_buttons = []  # For dynamic user selection buttons
 
+        # Assets load in the background; until _poll_assets swaps them in there is no sound and the background
+        # is the plain theme colour
         self.background_img = None
-        try:
-            self.background_img = pygame.image.load(os.path.join(ASSETS_DIR, 'background.jpg')).convert()
-            self.background_img = pygame.transform.scale(self.background_img, (SCREEN_WIDTH, SCREEN_HEIGHT))
-        except pygame.error:
-            print("Warning: background.jpg not found in assets folder. Using solid color background.")
-            self.background_img = None
-
-        self.key_press_sound = self._load_sound(os.path.join(AUDIO_DIR, 'key_press.wav'))
-        self.error_sound = self._load_sound(os.path.join(AUDIO_DIR, 'error.wav'))
-        self.game_start_sound = self._load_sound(os.path.join(AUDIO_DIR, 'game_start.wav'))
-        self.game_complete_sound = self._load_sound(os.path.join(AUDIO_DIR, 'game_complete.wav'))
+        self.audio = AudioEngine()  # The device is opened with the assets, so --audio-buffer can still change it
+        self._events_read_ns = None  # When _handle_events last read the event queue, for sound latency
+        self.assets = AssetManager(ASSET_CACHE_DIR)
 
         self.keyboard_key_rects = {}  # Stores {char: pygame.Rect} for drawing/heatmap
-
-    def _load_sound(self, path):
-        try:
-            sound = pygame.mixer.Sound(path)
-            if "key_press" in path:
-                sound.set_volume(0.3)
-            return sound
-        except FileNotFoundError:
-            print(f"Warning: Sound file not found: {path}. Skipping this sound.")
-            return None
-        except pygame.error as e:
-            print(f"Warning: Could not load sound file {path} due to Pygame error: {e}. Skipping this sound.")
-            return None
-
-    def _play_sound(self, sound):
-        """Plays a sound if it's loaded."""
-        if sound:
-            sound.play()
+        self.keyboard_rect = None  # Bounding box of all keys
+        self._build_keyboard_key_rects()
+        self.keyboard_surface = None  # All keys in their normal state, baked once per theme
+        self.key_colors = {}  # {char: (key_color, text_color)}, updated per keystroke
+        self._dirty_keys = set()  # Keys whose colours changed since the last frame
+        self.glyph_cache = GlyphCache()
+
+        # Dirty-rectangle rendering state (see _draw_ui)
+        self.input_revision = 0  # Bumped on every edit of input_buffer
+        self.background_cache = None  # Themed fill + background image, restored under dirty regions
+        self._last_frame_key = None  # (state, theme) of the last full redraw
+        self._last_static_signature = None
+        self._last_typing_signatures = {}
+        self._dirty_char_indices = set()  # Target paragraph indices whose colour changed since last frame
+        self.static_screen_cache = {}  # {state: (content key, surface)} for MENU/PARAGRAPH_SELECT/USER_SELECT/RESULTS
+
+        self.profiler = FrameProfiler(FPS) if profile else None  # Phase timing from python main.py --profile
+        self.surface_allocations = 0  # Surfaces created outside the glyph caches, reported by the profiler
+        self._profiler_overlay = (None, None)  # (lines, surface)
+
+    def _start_assets(self):
+        """Opens the audio device and starts loading the background and sounds; called once the first frame is up."""
+        self.assets.load_image("background_img", os.path.join(ASSETS_DIR, 'background.jpg'),
+                               (SCREEN_WIDTH, SCREEN_HEIGHT), cache_name="background")
+        if self.audio.open():
+            for name, (filename, _, _) in SOUND_FILES.items():
+                self.assets.load_sound(name, os.path.join(AUDIO_DIR, filename))
+        self.assets.start()
+
+    def _poll_assets(self):
+        """Swaps assets that finished loading in for their placeholders."""
+        for name, asset in self.assets.poll():
+            if name == "background_img":
+                self.background_img = asset
+                self.background_cache = None
+                self.static_screen_cache = {}
+                self._last_frame_key = None  # Full redraw with the image next frame
+            elif asset:
+                _, volume, pool = SOUND_FILES[name]
+                self.audio.add_sound(name, asset, volume, pool)
+        if not self.assets.pending and self.assets_ready_ms is None:
+            self.assets_ready_ms = (time.perf_counter_ns() - self._init_start_ns) / 1e6
+
+    def _play_sound(self, name, input_ns=None):
+        """Plays a sound if it's loaded; input_ns is when the keystroke behind it was read, for the latency report."""
+        self.audio.play(name, input_ns)
 
     def _load_paragraphs(self):
-        """Loads paragraphs from sentences.txt, ensuring each line is a valid paragraph."""
-        paragraphs = []
+        """Opens sentences.txt as a LineCorpus: each non-blank line is a paragraph, read on demand."""
         try:
-            with open(SENTENCES_FILE, 'r', encoding='utf-8') as f:
-                for line in f:
-                    stripped_line = line.strip()
-                    if stripped_line:
-                        paragraphs.append(stripped_line)
-            if not paragraphs:
-                print(f"Warning: {SENTENCES_FILE} is empty or contains no valid paragraphs.")
-                return ["No paragraphs found. Add some to sentences.txt!"]
-            return paragraphs
+            corpus = LineCorpus(SENTENCES_FILE)
         except FileNotFoundError:
             print(f"Error: {SENTENCES_FILE} not found. Please create it in the same directory.")
             return ["Error: sentences.txt not found!"]
+        if not len(corpus):
+            print(f"Warning: {SENTENCES_FILE} is empty or contains no valid paragraphs.")
+            corpus.close()
+            return ["No paragraphs found. Add some to sentences.txt!"]
+        return corpus
+
+    def _random_paragraph_index(self):
+        """Uniformly random index into self.paragraphs (a LineCorpus, or a fallback message list)."""
+        if isinstance(self.paragraphs, LineCorpus):
+            return self.paragraphs.random_index()
+        return random.randrange(len(self.paragraphs))
 
     def _set_theme(self, theme_name):
         """Sets the current theme for the game."""
@@ -255,38 +665,26 @@ class Game:
             print(f"Warning: Theme '{theme_name}' not found. Reverting to default.")
             self.current_theme_name = DEFAULT_THEME
             self.current_theme_colors = THEMES[DEFAULT_THEME]
-
-    def _load_users_data(self):
-        """Loads all user profiles and their typing history from users.json."""
-        try:
-            with open(USERS_FILE, 'r') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            print(f"No {USERS_FILE} found or file corrupted. Starting with empty user data.")
-            return {"users": {}}
-
-    def _save_users_data(self):
-        """Saves all user profiles and their typing history to users.json."""
-        try:
-            with open(USERS_FILE, 'w') as f:
-                json.dump(self.users_data, f, indent=4)
-        except IOError:
-            print(f"Error: Could not save user data to {USERS_FILE}.")
+        self.glyph_cache.clear()  # Cached glyphs are coloured with the old palette
+        self.label_cache.clear()
+        self.background_cache = None
+        self.static_screen_cache = {}
+        self._wpm_graph_cache = (None, None)
+        self.keyboard_surface = None
+        self._refresh_all_key_colors()
 
     def _create_user(self, username):
         """Creates a new user profile."""
-        if username and username not in self.users_data["users"]:
-            self.users_data["users"][username] = {
-                "high_wpm": 0,
-                "low_wpm": float('inf'),  # Store as inf for proper comparison, handle during display
-                "history": []  # List of dicts: {'wpm', 'accuracy', 'time', 'errors', 'paragraph', 'date'}
-            }
-            self._save_users_data()
+        if username and self.user_store.create_user(username):
+            self.user_index[username] = {"high_wpm": 0, "low_wpm": float('inf')}
             self.current_user = username
+            self.key_latency = KeyLatency()
+            self.high_wpm = 0
+            self.low_wpm = float('inf')
             self.current_state = MENU
             print(f"User '{username}' created and selected.")
             return True
-        elif username in self.users_data["users"]:
+        elif username:
             print(f"User '{username}' already exists.")
             return False
         else:
@@ -295,40 +693,47 @@ class Game:
 
     def _select_user(self, username):
         """Selects an existing user profile."""
-        if username in self.users_data["users"]:
+        user_profile = self.profile_cache.get(username) if username in self.user_index else None
+        if user_profile is not None:
             self.current_user = username
             # Update game's high/low WPM from user's data
-            self.high_wpm = self.users_data["users"][username].get("high_wpm", 0)
-            self.low_wpm = self.users_data["users"][username].get("low_wpm", float('inf'))
+            self.high_wpm = user_profile["high_wpm"]
+            self.low_wpm = user_profile["low_wpm"]
+            self.key_latency = self._load_key_latency(username)
             self.current_state = MENU
             print(f"User '{username}' selected.")
         else:
             print(f"User '{username}' not found.")
 
-    def _update_user_scores(self, wpm, accuracy, total_time, errors, paragraph):
-        """Updates the current user's high/low WPM and adds session to history."""
+    def _load_key_latency(self, username):
+        data = self.user_store.get_key_latency(username)
+        if data is None:
+            return KeyLatency()
+        try:
+            return KeyLatency.from_bytes(data)
+        except ValueError as e:
+            print(f"Warning: Ignoring unreadable key latency data of '{username}': {e}")
+            return KeyLatency()
+
+    def _update_user_scores(self, wpm, accuracy, total_time, errors, paragraph, keylog=None):
+        """Adds the session and its keystroke log to the current user's history and refreshes their high/low WPM."""
         if not self.current_user:
             return  # Cannot save if no user selected
 
-        user_profile = self.users_data["users"][self.current_user]
-
-        # Update high/low WPM
-        if wpm > user_profile["high_wpm"]:
-            user_profile["high_wpm"] = wpm
-        if wpm < user_profile["low_wpm"] and wpm > 0:
-            user_profile["low_wpm"] = wpm
-
-        user_profile["history"].append({
-            "wpm": round(wpm),
-            "accuracy": round(accuracy, 1),
-            "time": round(total_time, 1),
+        session = {
+            "wpm": wpm,
+            "accuracy": accuracy,
+            "time": total_time,
             "errors": errors,
-            "paragraph": paragraph[:50] + "..." if len(paragraph) > 50 else paragraph,  # Store snippet
+            "paragraph": paragraph_snippet(paragraph),
             "date": time.strftime("%Y-%m-%d %H:%M:%S")
-        })
-        user_profile["history"] = user_profile["history"][-50:]  # Keep last 50 entries
-
-        self._save_users_data()
+        }
+        user_profile = self.user_store.add_session(self.current_user, session, keylog)
+        self.user_index[self.current_user] = user_profile
+        self.profile_cache.record_session(self.current_user, session, user_profile)
+        self.leaderboard.record_session(self.current_user, session)
+        self.analytics.invalidate(self.current_user)
+        self.user_store.save_key_latency(self.current_user, self.key_latency.to_bytes())
         # Also update game's internal high/low for display
         self.high_wpm = user_profile["high_wpm"]
         self.low_wpm = user_profile["low_wpm"]
@@ -351,12 +756,29 @@ class Game:
 
         return wrapped_lines
 
+    def _get_paragraph_layout(self):
+        """Returns the layout of target_paragraph, rebuilding it only if the paragraph, font or width changed."""
+        if self.paragraph_layout is None or not self.paragraph_layout.matches(self.target_paragraph, self.font_sm,
+                                                                              INPUT_BOX_WIDTH):
+            self.paragraph_layout = ParagraphLayout(self.target_paragraph, self.font_sm, INPUT_BOX_WIDTH, INPUT_BOX_X)
+        return self.paragraph_layout
+
+    def _paragraph_first_line(self):
+        """First line in the paragraph viewport: the cursor line stays PARAGRAPH_LEAD_LINES from the top until the
+        end of the passage is in view."""
+        layout = self._get_paragraph_layout()
+        first_line = max(0, layout.line_of(self.scoring.typed_count) - PARAGRAPH_LEAD_LINES)
+        layout.wrap_lines(first_line + PARAGRAPH_VIEW_LINES + PARAGRAPH_WRAP_AHEAD)
+        if layout.complete:
+            first_line = max(0, min(first_line, len(layout.lines) - PARAGRAPH_VIEW_LINES))
+        return first_line
+
     def _draw_text_multiline(self, screen, text, font, color, center_x, start_y, max_width=None,
                              line_spacing_factor=1.2, align="center"):
         lines = self._wrap_text(text, font, max_width) if max_width else [text]
         current_y = start_y
         for line in lines:
-            text_surface = font.render(line, True, color)
+            text_surface = self.label_cache.get(font, line, color)
             text_rect = text_surface.get_rect()
             if align == "center":
                 text_rect.center = (center_x, current_y)
@@ -368,52 +790,102 @@ class Game:
             screen.blit(text_surface, text_rect)
             current_y += font.get_linesize() * line_spacing_factor
 
-    def _reset_game(self):
-        """Resets game variables and initiates countdown."""
-        self.input_text = ""
+    def _reset_game(self, paragraph=None):
+        """Resets game variables and initiates countdown, on paragraph or else the selected one."""
+        self.input_buffer.clear()
+        self.input_revision += 1
         self.time_start = 0
         self.total_time = 0
         self.errors = 0
         self.wpm = 0
         self.accuracy = 0.0
         self.input_scroll_offset_x = 0
-        self.wpm_history = []
+        self.wpm_timeline.reset()
         self.error_char_map = {}
         self.detailed_errors = {'insertions': 0, 'omissions': 0, 'substitutions': 0}
         self.key_heatmap_data = {char: 0 for row in KEYBOARD_LAYOUT for char in row}  # Initialize all keys to 0 errors
-        self.last_typed_char_pos = 0  # For error type tracking
 
-        self.target_paragraph = self.paragraphs[self.selected_paragraph_index]
+        if paragraph is None:
+            paragraph = self.passage or self.paragraphs[self.selected_paragraph_index]
+        self.target_paragraph = paragraph
+        self.scoring.reset(self.target_paragraph)
+        self.alignment.reset(self.target_paragraph)
+        self.keystroke_log.reset(self.target_paragraph)
+        self._get_paragraph_layout()
+        self.errors = self.scoring.errors
         self.current_key_to_press = self.target_paragraph[0] if self.target_paragraph else ''
+        self._refresh_all_key_colors()
 
         self.countdown_number = 3
-        self.countdown_start_time = pygame.time.get_ticks()
+        self.countdown_start_time = ticks_ms()
         self.current_state = COUNTDOWN
 
     def _calculate_results(self):
         """Calculates final metrics and transitions to results state."""
-        self.total_time = time.time() - self.time_start
+        if self.replay is None:
+            # Recorded first so the total time is the FINISH timestamp a replay of this log ends on
+            self.keystroke_log.record(13, self.scoring.typed_count, FINISH)
+            self.total_time = self.keystroke_log.timestamps[len(self.keystroke_log) - 1] / 1e9
+        else:
+            self.total_time = self.replay.elapsed_seconds
         if self.total_time == 0: self.total_time = 0.1
 
-        correct_chars = 0
-        for i in range(min(len(self.input_text), len(self.target_paragraph))):
-            if self.input_text[i] == self.target_paragraph[i]:
-                correct_chars += 1
-
-        self.wpm = (len(self.input_text) / 5) / (self.total_time / 60)
+        self.wpm = self.scoring.wpm(self.total_time)
+        self.accuracy = self.scoring.accuracy
+        self.errors = self.scoring.errors
+        self.detailed_errors = self.alignment.final_counts()  # Untyped rest of the passage counts as omitted
 
+        if self.replay is None:  # A replayed test is already in the history, with its original timings
+            self.last_keylog = self.keystroke_log.to_bytes()
+            self._update_user_scores(self.wpm, self.accuracy, self.total_time, self.errors, self.target_paragraph,
+                                     self.last_keylog)
+        self.replay = None
 
-        self.accuracy = (correct_chars / len(self.input_text)) * 100 if len(self.input_text) > 0 else 0.0
-
-        self._update_user_scores(self.wpm, self.accuracy, self.total_time, self.errors, self.target_paragraph)
-
-        self._play_sound(self.game_complete_sound)
+        self._play_sound("game_complete")
         self.current_state = RESULTS
 
+    def _typing_elapsed(self):
+        """Seconds since typing began: the keystroke log's clock, or the replay clock during a replay."""
+        if self.replay:
+            return self.replay.elapsed_seconds
+        return self.keystroke_log.elapsed_ns() / 1e9
+
+    def _start_replay(self, log, speed=1):
+        """Replays a KeystrokeLog through TYPING at speed times real time (None: as fast as possible)."""
+        self._reset_game(log.text)
+        self.replay = Replay(log, speed)
+        self.current_state = TYPING  # No countdown, the log starts at the first keystroke
+        self.time_start = time.time()
+        self.keystroke_log.start()
+        self.replay.start()
+
+    def replay_headless(self, log):
+        """Re-scores a recorded test without waiting or drawing. Returns the recomputed metrics."""
+        self._start_replay(log, speed=None)
+        for key, unicode in self.replay.due():
+            self._apply_keystroke(key, unicode)
+        if self.current_state == TYPING:  # Log without a finishing Enter
+            self._calculate_results()
+        return {"wpm": self.wpm, "accuracy": self.accuracy, "time": self.total_time, "errors": self.errors,
+                "detailed_errors": dict(self.detailed_errors)}
+
     def _handle_events(self):
+        self._events_read_ns = time.perf_counter_ns()
         for event in pygame.event.get():
             if event.type == QUIT:
                 self.running = False
+                self.user_store.flush()  # Don't lose the last session to an unfinished background write
+            if event.type == VIDEOEXPOSE:
+                self._last_frame_key = None  # Window contents were lost, force a full redraw
+            if event.type == KEYDOWN and event.key == HEATMAP_HOTKEY:
+                modes = list(HEATMAP_MODES)
+                self.heatmap_mode = modes[(modes.index(self.heatmap_mode) + 1) % len(modes)]
+                self._refresh_all_key_colors()
+                continue
+            if self.profiler and event.type == KEYDOWN and event.key == PROFILER_HOTKEY:
+                self.profiler.toggle_overlay()
+                self._last_frame_key = None  # Repaint whatever the overlay covered
+                continue
 
             if self.current_state == MENU:
                 if self.start_button.handle_event(event):
@@ -424,6 +896,11 @@ class Game:
                 if self.manage_users_button.handle_event(event):
                     self.current_state = USER_SELECT
                     self._create_user_selection_buttons()
+                if self.leaderboard_button.handle_event(event):
+                    self.current_state = LEADERBOARD
+                    self._show_leaderboard(self.leaderboard_view)
+                if self.stats_button.handle_event(event):
+                    self._show_stats()
                 if self.theme_toggle_button.handle_event(event):
                     if self.current_theme_name == "Dark Mode":
                         self._set_theme("Light Mode")
@@ -433,9 +910,31 @@ class Game:
             elif self.current_state == PARAGRAPH_SELECT:
                 for i, btn in enumerate(self.paragraph_buttons):
                     if btn.handle_event(event):
-                        self.selected_paragraph_index = i
-                        self.target_paragraph = self.paragraphs[self.selected_paragraph_index]
-                        self.current_state = MENU
+                        self._select_paragraph(self._paragraph_row_indices[i])
+                        break
+                if event.type == MOUSEWHEEL:
+                    self._scroll_paragraph_list(-event.y * 3)
+                elif event.type == KEYDOWN:
+                    self._handle_paragraph_picker_key(event)
+                if self.back_to_menu_button.handle_event(event):
+                    self.current_state = MENU
+
+            elif self.current_state == RESULTS:
+                if self.last_keylog and self.replay_button.handle_event(event):
+                    self._start_replay(KeystrokeLog.from_bytes(self.last_keylog))
+                elif self.restart_button.handle_event(event):
+                    self._reset_game()
+                elif self.back_to_menu_button.handle_event(event):
+                    self.current_state = MENU
+
+            elif self.current_state == STATS:
+                if self.back_to_menu_button.handle_event(event):
+                    self.current_state = MENU
+
+            elif self.current_state == LEADERBOARD:
+                for view, btn in self.leaderboard_tab_buttons.items():
+                    if btn.handle_event(event):
+                        self._show_leaderboard(view)
                 if self.back_to_menu_button.handle_event(event):
                     self.current_state = MENU
 
@@ -471,49 +970,78 @@ class Game:
 
             elif self.current_state == TYPING:
                 if event.type == KEYDOWN:
-                    self.cursor_timer = pygame.time.get_ticks()
-                    self.cursor_visible = True
-
-                    if event.key == K_BACKSPACE:
-                        if self.input_text:
-                            # If we're deleting an error that was recorded as substitution/insertion
-                            # This part is tricky to perfectly undo detailed error counts, simpler to just decrement total_errors
-                            self.input_text = self.input_text[:-1]
-                            self._play_sound(self.key_press_sound)
-                            self.current_key_to_press = self.target_paragraph[len(self.input_text)] if len(
-                                self.input_text) < len(self.target_paragraph) else ''
-                    elif event.key == K_RETURN:
-                        self._calculate_results()
-                    elif event.key == K_ESCAPE:
-                        self.current_state = MENU
+                    if self.replay:
+                        self._handle_replay_key(event)
                     else:
-                        if event.unicode and len(self.input_text) < len(self.target_paragraph) + 100:
-                            typed_char = event.unicode
-                            target_char = self.target_paragraph[len(self.input_text)] if len(self.input_text) < len(
-                                self.target_paragraph) else ''
-
-                            if typed_char == target_char:
-                                self._play_sound(self.key_press_sound)
-                            else:
-                                self._play_sound(self.error_sound)
-                                self.errors += 1  # Increment total errors
-
-                                self.key_heatmap_data[typed_char.lower()] = self.key_heatmap_data.get(
-                                    typed_char.lower(), 0) + 1
-
-                                if len(self.input_text) < len(self.target_paragraph):
-                                    if typed_char != target_char:
-                                        self.detailed_errors['substitutions'] += 1
-                                else:  # typed beyond target, so it's an insertion
-                                    self.detailed_errors['insertions'] += 1
-
-                            self.input_text += typed_char
-                            # Update next key to press
-                            self.current_key_to_press = self.target_paragraph[len(self.input_text)] if len(
-                                self.input_text) < len(self.target_paragraph) else ''
+                        self._apply_keystroke(event.key, event.unicode)
+
+    def _apply_keystroke(self, key, unicode):
+        """Applies one TYPING keystroke, from the keyboard or a Replay."""
+        self.cursor_timer = ticks_ms()
+        self.cursor_visible = True
+        previous_key_to_press = self.current_key_to_press
+        input_ns = self._events_read_ns if self.replay is None else None  # Replayed keys have no real press
+
+        if key == K_BACKSPACE:
+            if self.input_buffer:
+                self.input_buffer.pop()
+                self.scoring.pop()
+                self.alignment.pop()
+                self.detailed_errors = self.alignment.counts()
+                self.keystroke_log.record(8, self.scoring.typed_count, BACKSPACE)
+                self.input_revision += 1
+                self._dirty_char_indices.add(self.scoring.typed_count)
+                self._play_sound("key_press", input_ns)
+                self.current_key_to_press = self.scoring.next_target_char()
+        elif key == K_RETURN:
+            self._calculate_results()
+        elif key == K_ESCAPE:
+            self.current_state = MENU
+        else:
+            if unicode and self.scoring.typed_count < self.scoring.target_length + 100:
+                typed_char = unicode
+
+                correct = self.scoring.push(typed_char)
+                self.alignment.push(typed_char)
+                self.detailed_errors = self.alignment.counts()
+                self.keystroke_log.record(ord(typed_char[0]), self.scoring.typed_count - 1,
+                                          CORRECT if correct else 0)
+                if self.replay is None:  # A replayed test's intervals were counted when it was typed
+                    self.key_latency.record_from_log(self.keystroke_log)
+                if correct:
+                    self._play_sound("key_press", input_ns)
+                else:
+                    self._play_sound("error", input_ns)
+
+                    self.key_heatmap_data[typed_char.lower()] = self.key_heatmap_data.get(
+                        typed_char.lower(), 0) + 1
+
+                self.input_buffer.append(typed_char)
+                self.input_revision += 1
+                self._dirty_char_indices.add(self.scoring.typed_count - 1)
+                # Update next key to press
+                self.current_key_to_press = self.scoring.next_target_char()
+        self.errors = self.scoring.errors
+        # Only the old/new next key and the mistyped key can change colour
+        self._update_key_colors(previous_key_to_press, self.current_key_to_press, unicode)
+
+    def _handle_replay_key(self, event):
+        """During a replay the keyboard only controls playback."""
+        if event.key == K_ESCAPE:
+            self.replay = None
+            self.current_state = MENU
+        elif event.key == K_UP:
+            self.replay.step_speed(1)
+        elif event.key == K_DOWN:
+            self.replay.step_speed(-1)
 
     def _update_game_state(self):
-        current_time_ms = pygame.time.get_ticks()
+        current_time_ms = ticks_ms()
+        if self.assets.pending:
+            self._poll_assets()
+
+        if self.current_state == PARAGRAPH_SELECT and self._search_pending:
+            self._poll_paragraph_search()
 
         if self.current_state == COUNTDOWN:
             elapsed_time_countdown = (current_time_ms - self.countdown_start_time) // 1000
@@ -521,143 +1049,459 @@ class Game:
             if self.countdown_number <= 0:
                 self.current_state = TYPING
                 self.time_start = time.time()
-                self._play_sound(self.game_start_sound)
+                self.keystroke_log.start()
+                self._play_sound("game_start")
 
         elif self.current_state == TYPING:
+            if self.replay:
+                self.replay.advance()
+                for key, unicode in self.replay.due():
+                    self._apply_keystroke(key, unicode)
+                if self.current_state != TYPING:
+                    return
             if self.time_start != 0:
-                self.total_time = time.time() - self.time_start
-
-                correct_chars_live = 0
-                for i in range(min(len(self.input_text), len(self.target_paragraph))):
-                    if self.input_text[i] == self.target_paragraph[i]:
-                        correct_chars_live += 1
+                self.total_time = self._typing_elapsed()
 
                 if self.total_time > 0:
-                    self.wpm = (len(self.input_text) / 5) / (self.total_time / 60)
-                    self.accuracy = (correct_chars_live / len(self.input_text)) * 100 if len(
-                        self.input_text) > 0 else 0.0
+                    self.wpm = self.scoring.wpm(self.total_time)
+                    self.accuracy = self.scoring.accuracy
 
-                    if len(self.wpm_history) == 0 or (
-                            self.total_time * 1000 - self.wpm_history[-1][0]) >= 1000:  # Every second
-                        self.wpm_history.append((self.total_time * 1000, self.wpm))
+                    self.wpm_timeline.add(self.total_time * 1000, self.wpm)
 
             if current_time_ms - self.cursor_timer > self.cursor_blink_rate:
                 self.cursor_visible = not self.cursor_visible
                 self.cursor_timer = current_time_ms
-            typed_surface = self.font_sm.render(self.input_text, True, self.current_theme_colors["FOREGROUND"])
-            typed_width = typed_surface.get_width()
+            typed_width = self.input_buffer.width
 
             if typed_width > INPUT_BOX_WIDTH - 20:  # 20px padding
                 self.input_scroll_offset_x = (INPUT_BOX_WIDTH - 20) - typed_width
             else:
                 self.input_scroll_offset_x = 0
 
-            
-            self.errors = 0
-            for i in range(min(len(self.input_text), len(self.target_paragraph))):
-                if self.input_text[i] != self.target_paragraph[i]:
-                    self.errors += 1
-            self.errors += max(0, len(self.input_text) - len(
-                self.target_paragraph))  # Count extra typed characters as errors
-            self.errors += max(0, len(self.target_paragraph) - len(self.input_text))
-
-            if self.current_state == RESULTS:  # Only calculate omissions precisely at the end
-                omissions_at_end = 0
-                if len(self.target_paragraph) > len(self.input_text):
-                    # All characters in target beyond input length are omissions
-                    omissions_at_end = len(self.target_paragraph) - len(self.input_text)
-                self.detailed_errors['omissions'] = omissions_at_end
-
     # --- UI Drawing Functions ---
     def _draw_ui(self):
-        current_colors = self.current_theme_colors
-        self.screen.fill(current_colors["BACKGROUND"])
-        if self.background_img:
-            self.screen.blit(self.background_img, (0, 0))
+        if not DIRTY_RECT_RENDERING:
+            self._draw_full_frame()
+            self._present()
+            return
 
-        # Draw Theme Toggle Button on all main screens
-        if self.current_state in [MENU, RESULTS, PARAGRAPH_SELECT, USER_SELECT, CREATE_USER]:
-            self.theme_toggle_button.draw(self.screen)
+        frame_key = (self.current_state, self.current_theme_name)
+        if frame_key != self._last_frame_key:
+            self._draw_full_frame()
+            self._present()
+            self._last_frame_key = frame_key
+            self._last_static_signature = self._static_screen_signature()
+            self._last_typing_signatures = self._typing_layer_signatures()
+            self._dirty_keys.clear()
+            self._dirty_char_indices.clear()
+            return
 
-        if self.current_state == MENU:
-            self._draw_menu_screen()
-        elif self.current_state == PARAGRAPH_SELECT:
-            self._draw_paragraph_select_screen()
-        elif self.current_state == USER_SELECT:
-            self._draw_user_select_screen()
-        elif self.current_state == CREATE_USER:
+        if self.current_state == TYPING:
+            dirty_rects = self._collect_typing_dirty_rects()
+            for rect in dirty_rects:
+                self._redraw_typing_region(rect)
+        else:
+            # Static screens only change on hover, text entry or countdown ticks; skip the frame otherwise
+            signature = self._static_screen_signature()
+            if signature == self._last_static_signature:
+                dirty_rects = []
+            else:
+                self._last_static_signature = signature
+                self._draw_full_frame()
+                dirty_rects = [self.screen.get_rect()]
+
+        self._present(dirty_rects)
+
+    def _present(self, dirty_rects=None):
+        """Flips the whole screen, or pushes just dirty_rects; the profiler overlay is drawn on top either way."""
+        profiler = self.profiler
+        if profiler:
+            profiler.lap("draw")
+            if profiler.overlay_visible:
+                overlay_rect = self._draw_profiler_overlay()
+                if dirty_rects is not None:
+                    dirty_rects.append(overlay_rect)
+        if dirty_rects is None:
+            pygame.display.flip()
+        elif dirty_rects:
+            pygame.display.update(dirty_rects)
+        if self.first_frame_ms is None:
+            self.first_frame_ms = (time.perf_counter_ns() - self._init_start_ns) / 1e6
+            self._start_assets()  # Nothing that can wait runs before the first frame
+        if profiler:
+            profiler.lap("flip")
+
+    def _draw_profiler_overlay(self):
+        """Blits the profiler's numbers in the bottom-left corner. Returns the rect it covers."""
+        lines = self.profiler.overlay_lines()
+        cached_lines, surface = self._profiler_overlay
+        if cached_lines is not lines:
+            line_height = self.font_key.get_linesize()
+            surface = pygame.Surface((max(self.font_key.size(line)[0] for line in lines) + 12,
+                                      line_height * len(lines) + 8))
+            self.surface_allocations += 1
+            surface.fill((0, 0, 0))
+            for i, line in enumerate(lines):
+                surface.blit(self.font_key.render(line, True, (255, 255, 0)), (6, 4 + i * line_height))
+            self._profiler_overlay = (lines, surface)
+        rect = surface.get_rect(bottomleft=(0, SCREEN_HEIGHT))
+        self.screen.blit(surface, rect)
+        return rect
+
+    def _get_background_cache(self):
+        """Returns the themed background layer, building it once per theme."""
+        if self.background_cache is None:
+            self.background_cache = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT)).convert()
+            self.surface_allocations += 1
+            self.background_cache.fill(self.current_theme_colors["BACKGROUND"])
+            if self.background_img:
+                self.background_cache.blit(self.background_img, (0, 0))
+        return self.background_cache
+
+    def _static_screen_signature(self):
+        """Everything a non-TYPING screen's appearance depends on."""
+        buttons = [self.start_button, self.restart_button, self.replay_button, self.select_paragraph_button,
+                   self.back_to_menu_button, self.manage_users_button, self.create_user_button,
+                   self.select_user_button, self.theme_toggle_button, self.leaderboard_button, self.stats_button] + \
+                  list(self.leaderboard_tab_buttons.values()) + self.paragraph_buttons + self.user_selection_buttons
+        return (tuple(btn.is_hovered for btn in buttons), len(self.paragraph_buttons), len(self.user_selection_buttons),
+                self.current_user, self.target_paragraph, self.countdown_number, self.new_user_input,
+                self.user_input_active and self.cursor_visible, self.back_to_menu_button.rect.y,
+                self.picker_revision, self.search_index is not None and self.search_index.ready,
+                self._static_screen_content_key())
+
+    def _typing_layer_signatures(self):
+        """Values behind each TYPING layer; a region is redrawn only when its value changes."""
+        return {
+            "header": self.replay.speed if self.replay else None,
+            "paragraph": self._paragraph_first_line(),
+            "input": (self.input_revision, self.cursor_visible),
+            "progress": int(self._progress_fill_width()),
+            "time": int(self.total_time),
+            "wpm": int(self.wpm),
+            "accuracy": f"{self.accuracy:.1f}",
+            "heatmap": self.heatmap_mode,
+        }
+
+    def _collect_typing_dirty_rects(self):
+        dirty_rects = []
+
+        layout = self._get_paragraph_layout()
+        char_height = self.font_sm.get_linesize()  # Rendered glyphs can be taller than get_height()
+        first_line = self._paragraph_first_line()
+        for index in self._dirty_char_indices:
+            if index < len(layout.text):
+                line = layout.line_of(index)
+                if first_line <= line < first_line + PARAGRAPH_VIEW_LINES:
+                    y = PARAGRAPH_VIEW_Y + layout.line_y(line - first_line)
+                    dirty_rects.append(pygame.Rect(layout.xs[index], y, layout.widths[index], char_height))
+        self._dirty_char_indices.clear()
+
+        signatures = self._typing_layer_signatures()
+        for name, rect in self._typing_layer_rects().items():
+            if signatures[name] != self._last_typing_signatures.get(name):
+                dirty_rects.append(rect)
+        self._last_typing_signatures = signatures
+
+        for char in self._dirty_keys:
+            dirty_rects.append(self.keyboard_key_rects[char])
+        self._dirty_keys.clear()
+
+        return dirty_rects
+
+    def _typing_layer_rects(self):
+        stats_y = SCREEN_HEIGHT - 80 - 20
+        return {
+            "header": pygame.Rect(0, 30, SCREEN_WIDTH, 40),
+            "paragraph": pygame.Rect(INPUT_BOX_X, PARAGRAPH_VIEW_Y, INPUT_BOX_WIDTH,
+                                     self._get_paragraph_layout().line_y(PARAGRAPH_VIEW_LINES)),
+            "input": pygame.Rect(INPUT_BOX_X - 1, INPUT_BOX_Y - 1, INPUT_BOX_WIDTH + 2, INPUT_BOX_HEIGHT + 2),
+            "progress": pygame.Rect(PROGRESS_BAR_X, PROGRESS_BAR_Y, PROGRESS_BAR_WIDTH, PROGRESS_BAR_HEIGHT),
+            "time": pygame.Rect(SCREEN_WIDTH // 2 - 200 - 95, stats_y, 190, 40),
+            "wpm": pygame.Rect(SCREEN_WIDTH // 2 - 95, stats_y, 190, 40),
+            "accuracy": pygame.Rect(SCREEN_WIDTH // 2 + 200 - 95, stats_y, 190, 40),
+            "heatmap": pygame.Rect(self.keyboard_rect.right + 10, self.keyboard_rect.top, 170, 20),
+        }
+
+    def _redraw_typing_region(self, rect):
+        """Restores the background under rect and redraws, clipped, every TYPING layer in paint order."""
+        layer_rects = self._typing_layer_rects()
+        self.screen.blit(self._get_background_cache(), rect, rect)
+        self.screen.set_clip(rect)
+        if rect.top < 70:
+            self._draw_typing_header()
+        self._draw_target_paragraph(rect)
+        if rect.colliderect(layer_rects["input"]):
+            self._draw_input_box()
+        if rect.colliderect(layer_rects["progress"]):
+            self._draw_progress_bar()
+        if rect.collidelist([layer_rects["time"], layer_rects["wpm"], layer_rects["accuracy"]]) != -1:
+            self._draw_live_stats()
+        self._draw_on_screen_keyboard(rect)
+        if rect.colliderect(layer_rects["heatmap"]):
+            self._draw_heatmap_label()
+        self.screen.set_clip(None)
+
+    def _draw_full_frame(self):
+        if self.current_state in STATIC_SCREENS:
+            # Pre-composited screen, with hovered buttons drawn over it
+            self.screen.blit(self._get_static_screen(), (0, 0))
+            for btn in self._static_screen_buttons():
+                if btn.is_hovered:
+                    btn.draw(self.screen)
+            return
+
+        self.screen.blit(self._get_background_cache(), (0, 0))
+
+        if self.current_state == CREATE_USER:
+            self.theme_toggle_button.draw(self.screen)  # Pre-composited screens include it already
             self._draw_create_user_screen()
         elif self.current_state == COUNTDOWN:
             self._draw_countdown_screen()
         elif self.current_state == TYPING:
             self._draw_typing_screen()
-        elif self.current_state == RESULTS:
-            self._draw_results_screen()
 
-        pygame.display.flip()
+    def _static_screen_buttons(self):
+        """Buttons on the current pre-composited screen; hovered ones are drawn over the cached surface."""
+        if self.current_state == MENU:
+            buttons = [self.start_button, self.select_paragraph_button, self.manage_users_button,
+                       self.leaderboard_button, self.stats_button]
+        elif self.current_state == PARAGRAPH_SELECT:
+            buttons = self.paragraph_buttons + [self.back_to_menu_button]
+        elif self.current_state == USER_SELECT:
+            buttons = [self.create_user_button] + self.user_selection_buttons + [self.back_to_menu_button]
+        elif self.current_state == RESULTS:
+            buttons = [self.restart_button, self.back_to_menu_button]
+            if self.last_keylog:
+                buttons.append(self.replay_button)
+        elif self.current_state == LEADERBOARD:
+            buttons = list(self.leaderboard_tab_buttons.values()) + [self.back_to_menu_button]
+        elif self.current_state == STATS:
+            buttons = [self.back_to_menu_button]
+        else:
+            return []
+        return buttons + [self.theme_toggle_button]
 
-    def _draw_menu_screen(self):
+    def _static_screen_content_key(self):
+        """Everything besides theme and hover that a pre-composited screen shows."""
+        if self.current_state == MENU:
+            content = (self.current_user, self.high_wpm, self.low_wpm,
+                       self.target_paragraph)
+        elif self.current_state == PARAGRAPH_SELECT:
+            content = (self.picker_revision, self.search_index.ready, self.paragraph_query, self._search_pending)
+        elif self.current_state == LEADERBOARD:
+            content = (self.leaderboard_view, self.target_paragraph,
+                       tuple((row["username"], row["wpm"], row["date"]) for row in self.leaderboard_rows))
+        elif self.current_state == STATS:
+            content = (self.current_user, self.user_stats["sessions"] if self.user_stats else None)
+        elif self.current_state == RESULTS:
+            content = (self.wpm, self.accuracy, self.total_time, self.errors,
+                       tuple(self.detailed_errors.values()), self.wpm_timeline.revision)
+        else:
+            content = None
+        return (self.current_theme_name, content, tuple((btn.text, btn.rect.topleft)
+                                                         for btn in self._static_screen_buttons()))
+
+    def _get_static_screen(self):
+        """Returns the current screen composited once (background, text, buttons in their normal state)."""
+        content_key = self._static_screen_content_key()
+        cached = self.static_screen_cache.get(self.current_state)
+        if cached and cached[0] == content_key:
+            return cached[1]
+
+        surface = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT)).convert()
+        self.surface_allocations += 1
+        surface.blit(self._get_background_cache(), (0, 0))
+        if self.current_state == MENU:
+            self._draw_menu_screen(surface)
+        elif self.current_state == PARAGRAPH_SELECT:
+            self._draw_paragraph_select_screen(surface)
+        elif self.current_state == USER_SELECT:
+            self._draw_user_select_screen(surface)
+        elif self.current_state == RESULTS:
+            self._draw_results_screen(surface)
+        elif self.current_state == LEADERBOARD:
+            self._draw_leaderboard_screen(surface)
+        elif self.current_state == STATS:
+            self._draw_stats_screen(surface)
+        for btn in self._static_screen_buttons():
+            btn.draw(surface, hovered=False)
+
+        self.static_screen_cache[self.current_state] = (content_key, surface)
+        return surface
+
+    def _draw_menu_screen(self, surface):
         current_colors = self.current_theme_colors
-        self._draw_text_multiline(self.screen, "Typing Speed Master", self.font_lg, current_colors["PRIMARY_ACCENT"],
+        self._draw_text_multiline(surface, "Typing Speed Master", self.font_lg, current_colors["PRIMARY_ACCENT"],
                                   SCREEN_WIDTH // 2, 100)
-        self._draw_text_multiline(self.screen, "Improve your typing skills!", self.font_sm, current_colors["HIGHLIGHT"],
+        self._draw_text_multiline(surface, "Improve your typing skills!", self.font_sm, current_colors["HIGHLIGHT"],
                                   SCREEN_WIDTH // 2, 180)
 
         # Display Current User
         user_display = self.current_user if self.current_user else "Guest"
-        self._draw_text_multiline(self.screen, f"User: {user_display}", self.font_md, current_colors["FOREGROUND"],
+        self._draw_text_multiline(surface, f"User: {user_display}", self.font_md, current_colors["FOREGROUND"],
                                   SCREEN_WIDTH // 2, 250)
 
         # Display User's High/Low Scores
         if self.current_user:
-            user_profile = self.users_data["users"][self.current_user]
-            high_wpm_display = round(user_profile.get("high_wpm", 0))
-            low_wpm_display = round(user_profile.get("low_wpm", float('inf'))) if user_profile.get("low_wpm", float(
-                'inf')) != float('inf') else 'N/A'
-            self._draw_text_multiline(self.screen, f"High WPM: {high_wpm_display}", self.font_sm,
+            high_wpm_display = round(self.high_wpm)
+            low_wpm_display = round(self.low_wpm) if self.low_wpm != float('inf') else 'N/A'
+            self._draw_text_multiline(surface, f"High WPM: {high_wpm_display}", self.font_sm,
                                       current_colors["FOREGROUND"], SCREEN_WIDTH // 2, 300)
-            self._draw_text_multiline(self.screen, f"Low WPM: {low_wpm_display}", self.font_sm,
+            self._draw_text_multiline(surface, f"Low WPM: {low_wpm_display}", self.font_sm,
                                       current_colors["FOREGROUND"], SCREEN_WIDTH // 2, 340)
         else:
-            self._draw_text_multiline(self.screen, "Please select or create a user.", self.font_sm,
+            self._draw_text_multiline(surface, "Please select or create a user.", self.font_sm,
                                       current_colors["HIGHLIGHT"], SCREEN_WIDTH // 2, 320)
 
         selected_para_snippet = self.target_paragraph[:70] + "..." if len(
             self.target_paragraph) > 70 else self.target_paragraph
-        self._draw_text_multiline(self.screen, f"Selected: '{selected_para_snippet}'", self.font_xs,
+        self._draw_text_multiline(surface, f"Selected: '{selected_para_snippet}'", self.font_xs,
                                   current_colors["HIGHLIGHT"], SCREEN_WIDTH // 2, 400)
 
-        self.start_button.draw(self.screen)
-        self.select_paragraph_button.draw(self.screen)
-        self.manage_users_button.draw(self.screen)  # New button
-
-    def _draw_paragraph_select_screen(self):
+    def _draw_paragraph_select_screen(self, surface):
         current_colors = self.current_theme_colors
-        self._draw_text_multiline(self.screen, "Select a Paragraph", self.font_md, current_colors["PRIMARY_ACCENT"],
+        self._draw_text_multiline(surface, "Select a Paragraph", self.font_md, current_colors["PRIMARY_ACCENT"],
                                   SCREEN_WIDTH // 2, 50)
 
-        for btn in self.paragraph_buttons:
-            btn.draw(self.screen)
-
-        self.back_to_menu_button.draw(self.screen)
-
-    def _draw_user_select_screen(self):
+        # Search box
+        search_rect = pygame.Rect(PICKER_SEARCH_RECT)
+        pygame.draw.rect(surface, current_colors["HIGHLIGHT"], search_rect, 2, border_radius=8)
+        if self.paragraph_query:
+            query_text, query_color = self.paragraph_query, current_colors["FOREGROUND"]
+        else:
+            query_text, query_color = "Type to search...", current_colors["HIGHLIGHT"]
+        self._draw_text_multiline(surface, query_text, self.font_xs, query_color, search_rect.x + 10,
+                                  search_rect.centery, align="left")
+
+        # Match count and visible range
+        matches = self._paragraph_matches()
+        if self._search_pending:
+            status = "Searching..." if self.search_index.ready else "Building search index..."
+        elif not matches:
+            status = "No matching paragraphs"
+        else:
+            noun = "matches" if self.paragraph_results is not None else "paragraphs"
+            status = (f"{self.paragraph_scroll + 1}-{self.paragraph_scroll + len(self.paragraph_buttons)} "
+                      f"of {len(matches):,} {noun}")
+        self._draw_text_multiline(surface, status, self.font_xs, current_colors["HIGHLIGHT"], search_rect.right,
+                                  search_rect.bottom + 18, align="right")
+
+        # Scrollbar
+        visible_rows = len(self.paragraph_row_pool)
+        if len(matches) > visible_rows:
+            track_rect = pygame.Rect(search_rect.right + 10, PICKER_LIST_Y, 8,
+                                     visible_rows * PICKER_ROW_SPACING - (PICKER_ROW_SPACING - PICKER_ROW_HEIGHT))
+            thumb_height = max(20, track_rect.height * visible_rows // len(matches))
+            thumb_y = track_rect.y + (track_rect.height - thumb_height) * self.paragraph_scroll // max(
+                1, len(matches) - visible_rows)
+            pygame.draw.rect(surface, current_colors["SECONDARY"], track_rect, border_radius=4)
+            pygame.draw.rect(surface, current_colors["HIGHLIGHT"], (track_rect.x, thumb_y, track_rect.width,
+                                                                     thumb_height), border_radius=4)
+
+    def _draw_user_select_screen(self, surface):
         current_colors = self.current_theme_colors
-        self._draw_text_multiline(self.screen, "Manage Users", self.font_md, current_colors["PRIMARY_ACCENT"],
+        self._draw_text_multiline(surface, "Manage Users", self.font_md, current_colors["PRIMARY_ACCENT"],
                                   SCREEN_WIDTH // 2, 50)
 
-        self.create_user_button.draw(self.screen)
-
-        # Draw existing user buttons
+        # Hint when there are no user buttons to list
         y_offset = SCREEN_HEIGHT // 2 + 240
         if not self.user_selection_buttons:
-            self._draw_text_multiline(self.screen, "No users found. Create one!", self.font_sm,
+            self._draw_text_multiline(surface, "No users found. Create one!", self.font_sm,
                                       current_colors["HIGHLIGHT"], SCREEN_WIDTH // 2, y_offset)
 
-        for btn in self.user_selection_buttons:
-            btn.draw(self.screen)
+    def _draw_leaderboard_screen(self, surface):
+        current_colors = self.current_theme_colors
+        self._draw_text_multiline(surface, "Leaderboard", self.font_md, current_colors["PRIMARY_ACCENT"],
+                                  SCREEN_WIDTH // 2, 45)
 
-        self.back_to_menu_button.draw(self.screen)
+        if self.leaderboard_view == "paragraph":
+            caption = f"Paragraph: '{paragraph_snippet(self.target_paragraph)}'"
+        elif self.leaderboard_view == "today":
+            caption = f"Today ({time.strftime('%Y-%m-%d')})"
+        else:
+            caption = "All time"
+        self._draw_text_multiline(surface, caption, self.font_xs, current_colors["HIGHLIGHT"], SCREEN_WIDTH // 2, 150)
+
+        columns = [(130, "#"), (190, "User"), (500, "WPM"), (600, "Accuracy"), (730, "Date")]
+        for x, heading in columns:
+            self._draw_text_multiline(surface, heading, self.font_xs, current_colors["SECONDARY_ACCENT"], x, 185,
+                                      align="left")
+        if not self.leaderboard_rows:
+            self._draw_text_multiline(surface, "No sessions yet.", self.font_sm, current_colors["HIGHLIGHT"],
+                                      SCREEN_WIDTH // 2, 260)
+
+        y = 220
+        for rank, row in enumerate(self.leaderboard_rows, start=1):
+            values = [str(rank), row["username"], str(round(row["wpm"])), f"{row['accuracy']:.1f}%", row["date"]]
+            for (x, _), value in zip(columns, values):
+                self._draw_text_multiline(surface, value, self.font_xs, current_colors["FOREGROUND"], x, y,
+                                          align="left")
+            y += 34
+
+    def _draw_stats_screen(self, surface):
+        current_colors = self.current_theme_colors
+        user_display = self.current_user if self.current_user else "Guest"
+        self._draw_text_multiline(surface, f"Statistics: {user_display}", self.font_md,
+                                  current_colors["PRIMARY_ACCENT"], SCREEN_WIDTH // 2, 45)
+
+        stats = self.user_stats
+        if not numpy_available():
+            message = "Install NumPy (pip install numpy) to see statistics."
+        elif not self.current_user:
+            message = "Please select or create a user."
+        elif stats is None:
+            message = "No sessions yet."
+        else:
+            message = None
+        if message:
+            self._draw_text_multiline(surface, message, self.font_sm, current_colors["HIGHLIGHT"], SCREEN_WIDTH // 2,
+                                      SCREEN_HEIGHT // 2)
+            return
+
+        percentiles = stats["percentiles"]
+        correlation = stats["accuracy_speed_correlation"]
+        rows = [
+            ("Sessions", str(stats["sessions"])),
+            ("Average WPM", f"{stats['mean_wpm']:.1f}"),
+            ("Best WPM", f"{stats['best_wpm']:.1f}"),
+            ("Last 10 average", f"{stats['recent_wpm']:.1f}"),
+            ("Median (25th-75th)", f"{percentiles[50]:.0f} ({percentiles[25]:.0f}-{percentiles[75]:.0f})"),
+            ("10th / 90th percentile", f"{percentiles[10]:.0f} / {percentiles[90]:.0f}"),
+            ("Trend", f"{stats['trend_per_session']:+.2f} WPM/session"),
+            ("Consistency (std dev)", f"{stats['stddev_wpm']:.1f} WPM"),
+            ("Average accuracy", f"{stats['mean_accuracy']:.1f}%"),
+            ("Accuracy vs speed (r)", f"{correlation:+.2f}" if correlation is not None else "N/A"),
+        ]
+        y = 120
+        for label, value in rows:
+            self._draw_text_multiline(surface, label, self.font_xs, current_colors["HIGHLIGHT"], 50, y, align="left")
+            self._draw_text_multiline(surface, value, self.font_xs, current_colors["FOREGROUND"], 270, y,
+                                      align="left")
+            y += 36
+
+        self._draw_history_graph(surface, pygame.Rect(470, 105, 480, 320), stats)
+
+    def _draw_history_graph(self, surface, graph_rect, stats):
+        """Every session's WPM with its rolling average; long histories are sampled down to the graph width."""
+        current_colors = self.current_theme_colors
+        pygame.draw.rect(surface, current_colors["SECONDARY"], graph_rect, border_radius=5)
+        pygame.draw.rect(surface, current_colors["FOREGROUND"], graph_rect, 1, border_radius=5)
+
+        wpm = stats["wpm"]
+        rolling = stats["rolling_wpm"]
+        max_wpm = max(50.0, stats["best_wpm"])
+        session_points = graph_points(wpm, 0, len(wpm), graph_rect, max_wpm)
+        rolling_points = graph_points(rolling, len(wpm) - len(rolling), len(wpm), graph_rect, max_wpm)
+        for x, y in session_points:
+            pygame.draw.circle(surface, current_colors["HIGHLIGHT"], (x, y), 2)
+        if len(rolling_points) > 1:
+            pygame.draw.lines(surface, current_colors["PRIMARY_ACCENT"], False, rolling_points, 2)
+
+        self._draw_text_multiline(surface, f"WPM per session, {ROLLING_WINDOW}-session average", self.font_xs,
+                                  current_colors["HIGHLIGHT"], graph_rect.centerx, graph_rect.bottom + 20)
+        self._draw_text_multiline(surface, f"{max_wpm:.0f}", self.font_xs, current_colors["HIGHLIGHT"],
+                                  graph_rect.x - 8, graph_rect.y + 8, align="right")
 
     def _draw_create_user_screen(self):
         current_colors = self.current_theme_colors
@@ -671,6 +1515,7 @@ class Game:
         pygame.draw.rect(self.screen, current_colors["HIGHLIGHT"], input_rect, 2, border_radius=8)
 
         input_surface = self.font_sm.render(self.new_user_input, True, current_colors["FOREGROUND"])
+        self.surface_allocations += 1
         self.screen.blit(input_surface,
                          (input_rect.x + 10, input_rect.y + (input_rect.height - input_surface.get_height()) // 2))
 
@@ -691,60 +1536,96 @@ class Game:
                                   current_colors["PRIMARY_ACCENT"], SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2)
 
     def _draw_typing_screen(self):
-        current_colors = self.current_theme_colors
-        self._draw_text_multiline(self.screen, "Type the following paragraph:", self.font_sm,
-                                  current_colors["HIGHLIGHT"], SCREEN_WIDTH // 2, 50)
-
-        paragraph_lines = self._wrap_text(self.target_paragraph, self.font_sm, INPUT_BOX_WIDTH)
+        self._draw_typing_header()
+        self._draw_target_paragraph()
+        self._draw_input_box()
+        self._draw_progress_bar()
+        self._draw_live_stats()
+        self._draw_on_screen_keyboard()  # Draw the keyboard
+        self._draw_heatmap_label()
 
-        current_y_for_para = 120
-        total_chars_rendered = 0
+    def _draw_heatmap_label(self):
+        rect = self._typing_layer_rects()["heatmap"]
+        self._draw_text_multiline(self.screen, f"Heatmap: {HEATMAP_MODES[self.heatmap_mode]} (F2)", self.font_key,
+                                  self.current_theme_colors["HIGHLIGHT"], rect.x, rect.centery, align="left")
 
-        for line_idx, target_line in enumerate(paragraph_lines):
-            x_offset = INPUT_BOX_X + (INPUT_BOX_WIDTH - self.font_sm.size(target_line)[0]) // 2
-            current_char_x = x_offset
+    def _draw_typing_header(self):
+        if self.replay:
+            header = f"Replay at {self.replay.speed:g}x  (Up/Down: speed, Esc: stop)"
+        else:
+            header = "Type the following paragraph:"
+        self._draw_text_multiline(self.screen, header, self.font_sm, self.current_theme_colors["HIGHLIGHT"],
+                                  SCREEN_WIDTH // 2, 50)
 
-            for i, char in enumerate(target_line):
+    def _draw_target_paragraph(self, clip_rect=None):
+        """Draws the lines of the coloured target paragraph in the viewport; with clip_rect, only the glyphs that
+        intersect it."""
+        current_colors = self.current_theme_colors
+        layout = self._get_paragraph_layout()
+        typed_count = self.scoring.typed_count
+        char_height = self.font_sm.get_linesize()  # Rendered glyphs can be taller than get_height()
+        first_line = self._paragraph_first_line()
+
+        for line in range(first_line, min(first_line + PARAGRAPH_VIEW_LINES, len(layout.lines))):
+            start, end = layout.lines[line]
+            y = PARAGRAPH_VIEW_Y + layout.line_y(line - first_line)
+            if clip_rect and not (clip_rect.top < y + char_height and y < clip_rect.bottom):
+                continue
+            for i in range(start, end):
+                if clip_rect and not (clip_rect.left < layout.xs[i] + layout.widths[i] and
+                                      layout.xs[i] < clip_rect.right):
+                    continue
                 char_color = current_colors["HIGHLIGHT"]  # Default color for remaining text
 
-                if total_chars_rendered < len(self.input_text):
-                    if self.input_text[total_chars_rendered] == char:
+                if i < typed_count:
+                    if self.scoring.is_correct_at(i):
                         char_color = current_colors["CORRECT_TEXT"]
                     else:
                         char_color = current_colors["INCORRECT_TEXT"]
 
-                char_surface = self.font_sm.render(char, True, char_color)
-                self.screen.blit(char_surface, (current_char_x, current_y_for_para))
-                current_char_x += char_surface.get_width()
-                total_chars_rendered += 1
-
-            current_y_for_para += self.font_sm.get_linesize() * 1.2
+                char_surface = self.glyph_cache.get(self.font_sm, layout.text[i], char_color)
+                self.screen.blit(char_surface, (layout.xs[i], y))
 
+    def _draw_input_box(self):
+        current_colors = self.current_theme_colors
         # Draw the input box border
         pygame.draw.rect(self.screen, current_colors["PRIMARY_ACCENT"],
                          (INPUT_BOX_X, INPUT_BOX_Y, INPUT_BOX_WIDTH, INPUT_BOX_HEIGHT), 2, border_radius=8)
 
-        input_text_surface = self.font_sm.render(self.input_text, True, current_colors["FOREGROUND"])
+        # Only the tail that fits in the box is rendered, so the cost doesn't grow with the typed length
+        visible_start = self.input_buffer.index_at(-self.input_scroll_offset_x - 5)
+        cache_key = (self.input_revision, visible_start, current_colors["FOREGROUND"])
+        if self._input_surface_cache[0] != cache_key:
+            self._input_surface_cache = (cache_key, self.font_sm.render(self.input_buffer.slice(visible_start), True,
+                                                                        current_colors["FOREGROUND"]))
+            self.surface_allocations += 1
+        input_text_surface = self._input_surface_cache[1]
+        text_x = INPUT_BOX_X + 10 + self.input_scroll_offset_x + self.input_buffer.offset_of(visible_start)
 
         input_clip_rect = pygame.Rect(INPUT_BOX_X + 5, INPUT_BOX_Y + 5, INPUT_BOX_WIDTH - 10, INPUT_BOX_HEIGHT - 10)
-        self.screen.set_clip(input_clip_rect)
+        outer_clip_rect = self.screen.get_clip()  # Dirty-region redraws must not paint outside their region
+        self.screen.set_clip(input_clip_rect.clip(outer_clip_rect))
 
-        self.screen.blit(input_text_surface, (INPUT_BOX_X + 10 + self.input_scroll_offset_x,
-                                              INPUT_BOX_Y + (INPUT_BOX_HEIGHT - input_text_surface.get_height()) // 2))
+        self.screen.blit(input_text_surface,
+                         (text_x, INPUT_BOX_Y + (INPUT_BOX_HEIGHT - input_text_surface.get_height()) // 2))
 
         # Draw Blinking Cursor
         if self.cursor_visible:
-            cursor_x = INPUT_BOX_X + 10 + self.input_scroll_offset_x + input_text_surface.get_width()
+            cursor_x = text_x + input_text_surface.get_width()
             cursor_y = INPUT_BOX_Y + (INPUT_BOX_HEIGHT - self.font_sm.get_height()) // 2
             pygame.draw.line(self.screen, current_colors["CURSOR"], (cursor_x, cursor_y),
                              (cursor_x, cursor_y + self.font_sm.get_height()), 2)
 
-        self.screen.set_clip(None)
+        self.screen.set_clip(outer_clip_rect)
 
-        # Draw Progress Bar
-        progress_percentage = (len(self.input_text) / len(self.target_paragraph)) if len(
+    def _progress_fill_width(self):
+        progress_percentage = (len(self.input_buffer) / len(self.target_paragraph)) if len(
             self.target_paragraph) > 0 else 0
-        progress_fill_width = PROGRESS_BAR_WIDTH * progress_percentage
+        return PROGRESS_BAR_WIDTH * progress_percentage
+
+    def _draw_progress_bar(self):
+        current_colors = self.current_theme_colors
+        progress_fill_width = self._progress_fill_width()
 
         pygame.draw.rect(self.screen, current_colors["SECONDARY"],
                          (PROGRESS_BAR_X, PROGRESS_BAR_Y, PROGRESS_BAR_WIDTH, PROGRESS_BAR_HEIGHT), border_radius=5)
@@ -753,6 +1634,8 @@ class Game:
         pygame.draw.rect(self.screen, current_colors["FOREGROUND"],
                          (PROGRESS_BAR_X, PROGRESS_BAR_Y, PROGRESS_BAR_WIDTH, PROGRESS_BAR_HEIGHT), 1, border_radius=5)
 
+    def _draw_live_stats(self):
+        current_colors = self.current_theme_colors
         # Display Real-time Stats
         self._draw_text_multiline(self.screen, f"Time: {int(self.total_time)}s", self.font_sm,
                                   current_colors["FOREGROUND"], SCREEN_WIDTH // 2 - 200, SCREEN_HEIGHT - 80)
@@ -761,132 +1644,179 @@ class Game:
         self._draw_text_multiline(self.screen, f"Acc: {self.accuracy:.1f}%", self.font_sm, current_colors["FOREGROUND"],
                                   SCREEN_WIDTH // 2 + 200, SCREEN_HEIGHT - 80)
 
-        self._draw_on_screen_keyboard()  # Draw the keyboard
-
-    def _draw_on_screen_keyboard(self):
-        current_colors = self.current_theme_colors
+    def _build_keyboard_key_rects(self):
+        """Lays out the on-screen keyboard once; fills self.keyboard_key_rects and self.keyboard_rect."""
         keyboard_start_x = (SCREEN_WIDTH - (len(KEYBOARD_LAYOUT[0]) * (KEY_WIDTH + KEY_MARGIN) - KEY_MARGIN)) // 2
         keyboard_start_y = SCREEN_HEIGHT - 280  # Position the keyboard
 
-        # Build key rects if not already done (only once)
-        if not self.keyboard_key_rects:
-            for r_idx, row in enumerate(KEYBOARD_LAYOUT):
-                row_offset_x = 0
-                if r_idx == 1:  # QWERTY row offset
-                    row_offset_x = KEY_WIDTH // 2
-                elif r_idx == 2:  # ASDF row offset
-                    row_offset_x = KEY_WIDTH
-                elif r_idx == 3:  # ZXCV row offset
-                    row_offset_x = KEY_WIDTH * 1.25  # Slightly more offset
-                elif r_idx == 4:  # Spacebar
-                    row_offset_x = KEY_WIDTH * 2  # Center spacebar roughly
-
-                for c_idx, char in enumerate(row):
-                    x = keyboard_start_x + row_offset_x + c_idx * (KEY_WIDTH + KEY_MARGIN)
-                    y = keyboard_start_y + r_idx * (KEY_HEIGHT + KEY_MARGIN)
-                    # Special handling for spacebar size
-                    width = KEY_WIDTH
-                    if char == ' ':
-                        width = KEY_WIDTH * 6  # Make spacebar wider
-                        x = keyboard_start_x + row_offset_x + KEY_WIDTH * 3  # Center spacebar
-
-                    self.keyboard_key_rects[char] = pygame.Rect(x, y, width, KEY_HEIGHT)
-
-        # Draw keys
-        for char, rect in self.keyboard_key_rects.items():
-            key_color = current_colors["KEYBOARD_NORMAL"]
-            text_color = current_colors["KEYBOARD_TEXT"]
-
-            # Highlight next key to press
-            if char.lower() == self.current_key_to_press.lower():
-                key_color = current_colors["PRIMARY_ACCENT"]
-
-            # Heatmap coloring
-            error_count = self.key_heatmap_data.get(char.lower(), 0)
-            if error_count > 0:
-                if error_count > 5:  # Many errors
-                    key_color = current_colors["HEATMAP_HIGH"]
-                elif error_count > 2:  # Medium errors
-                    key_color = current_colors["HEATMAP_MEDIUM"]
-                else:  # Few errors
-                    key_color = current_colors["HEATMAP_LOW"]
-                text_color = current_colors["FOREGROUND"]  # Make text pop on colored key
-
-            pygame.draw.rect(self.screen, key_color, rect, border_radius=5)
-            pygame.draw.rect(self.screen, current_colors["SECONDARY"], rect, 1, border_radius=5)  # Border
-
-            char_display = char.upper() if char.islower() else char  # Display uppercase for letters
-            if char == ' ': char_display = "Space"  # Label for spacebar
-
-            text_surface = self.font_key.render(char_display, True, text_color)
-            text_rect = text_surface.get_rect(center=rect.center)
-            self.screen.blit(text_surface, text_rect)
-
-    def _draw_results_screen(self):
+        for r_idx, row in enumerate(KEYBOARD_LAYOUT):
+            row_offset_x = 0
+            if r_idx == 1:  # QWERTY row offset
+                row_offset_x = KEY_WIDTH // 2
+            elif r_idx == 2:  # ASDF row offset
+                row_offset_x = KEY_WIDTH
+            elif r_idx == 3:  # ZXCV row offset
+                row_offset_x = KEY_WIDTH * 1.25  # Slightly more offset
+            elif r_idx == 4:  # Spacebar
+                row_offset_x = KEY_WIDTH * 2  # Center spacebar roughly
+
+            for c_idx, char in enumerate(row):
+                x = keyboard_start_x + row_offset_x + c_idx * (KEY_WIDTH + KEY_MARGIN)
+                y = keyboard_start_y + r_idx * (KEY_HEIGHT + KEY_MARGIN)
+                # Special handling for spacebar size
+                width = KEY_WIDTH
+                if char == ' ':
+                    width = KEY_WIDTH * 6  # Make spacebar wider
+                    x = keyboard_start_x + row_offset_x + KEY_WIDTH * 3  # Center spacebar
+
+                self.keyboard_key_rects[char] = pygame.Rect(x, y, width, KEY_HEIGHT)
+
+        rects = list(self.keyboard_key_rects.values())
+        self.keyboard_rect = rects[0].unionall(rects[1:])
+
+    def _key_colors_for(self, char):
+        """Returns (key_color, text_color) for one on-screen key given the highlight and heatmap."""
+        current_colors = self.current_theme_colors
+        key_color = current_colors["KEYBOARD_NORMAL"]
+        text_color = current_colors["KEYBOARD_TEXT"]
+
+        # Highlight next key to press
+        if char.lower() == self.current_key_to_press.lower():
+            key_color = current_colors["PRIMARY_ACCENT"]
+
+        # Heatmap coloring, on a scale relative to the other keys
+        value = self._heatmap_values.get(char.lower())
+        if value is not None:
+            medium, high = self._heatmap_scale
+            if value > high:  # Slowest / most mistyped keys
+                key_color = current_colors["HEATMAP_HIGH"]
+            elif value > medium:
+                key_color = current_colors["HEATMAP_MEDIUM"]
+            else:
+                key_color = current_colors["HEATMAP_LOW"]
+            text_color = current_colors["FOREGROUND"]  # Make text pop on colored key
+
+        return key_color, text_color
+
+    def _update_heatmap_scale(self):
+        """Recomputes the heatmap values and percentile thresholds. Returns True if the thresholds moved."""
+        if self.heatmap_mode == "latency":
+            values = self.key_latency.key_means_ms()
+        else:
+            values = {char: count for char, count in self.key_heatmap_data.items() if count > 0}
+        self._heatmap_values = values
+        ordered = sorted(values.values())
+        scale = tuple(percentile(ordered, fraction) for fraction in HEATMAP_PERCENTILES) if ordered else None
+        changed = scale != self._heatmap_scale
+        self._heatmap_scale = scale
+        return changed
+
+    def _refresh_all_key_colors(self):
+        """Recomputes every key's colours (theme change, heatmap mode change or new test)."""
+        self._update_heatmap_scale()
+        self.key_colors = {char: self._key_colors_for(char) for char in self.keyboard_key_rects}
+        self._dirty_keys.update(self.keyboard_key_rects)
+
+    def _update_key_colors(self, *chars):
+        """Recomputes the colours of the given keys after a keystroke, marking the ones that changed."""
+        if self._update_heatmap_scale():
+            chars = self.keyboard_key_rects  # The colour scale moved, so any key may change
+        for char in chars:
+            if not char:
+                continue
+            char = char.lower()
+            if char not in self.keyboard_key_rects:
+                continue
+            colors = self._key_colors_for(char)
+            if colors != self.key_colors.get(char):
+                self.key_colors[char] = colors
+                self._dirty_keys.add(char)
+
+    def _draw_key(self, surface, char, rect, key_color, text_color):
+        pygame.draw.rect(surface, key_color, rect, border_radius=5)
+        pygame.draw.rect(surface, self.current_theme_colors["SECONDARY"], rect, 1, border_radius=5)  # Border
+
+        char_display = char.upper() if char.islower() else char  # Display uppercase for letters
+        if char == ' ': char_display = "Space"  # Label for spacebar
+
+        text_surface = self.glyph_cache.get(self.font_key, char_display, text_color)
+        text_rect = text_surface.get_rect(center=rect.center)
+        surface.blit(text_surface, text_rect)
+
+    def _get_keyboard_surface(self):
+        """Returns the keyboard with every key in its normal state, baked once per theme."""
+        if self.keyboard_surface is None:
+            current_colors = self.current_theme_colors
+            self.keyboard_surface = pygame.Surface(self.keyboard_rect.size, SRCALPHA)
+            self.surface_allocations += 1
+            for char, rect in self.keyboard_key_rects.items():
+                local_rect = rect.move(-self.keyboard_rect.x, -self.keyboard_rect.y)
+                self._draw_key(self.keyboard_surface, char, local_rect, current_colors["KEYBOARD_NORMAL"],
+                               current_colors["KEYBOARD_TEXT"])
+        return self.keyboard_surface
+
+    def _draw_on_screen_keyboard(self, clip_rect=None):
+        """Blits the baked keyboard and overlays only the keys that are highlighted or heat-coloured."""
         current_colors = self.current_theme_colors
-        self._draw_text_multiline(self.screen, "Results", self.font_lg, current_colors["PRIMARY_ACCENT"],
+        normal_colors = (current_colors["KEYBOARD_NORMAL"], current_colors["KEYBOARD_TEXT"])
+        if clip_rect and not self.keyboard_rect.colliderect(clip_rect):
+            return
+
+        self.screen.blit(self._get_keyboard_surface(), self.keyboard_rect)
+        for char, colors in self.key_colors.items():
+            if colors == normal_colors:
+                continue
+            rect = self.keyboard_key_rects[char]
+            if clip_rect and not rect.colliderect(clip_rect):
+                continue
+            self._draw_key(self.screen, char, rect, *colors)
+
+    def _draw_results_screen(self, surface):
+        current_colors = self.current_theme_colors
+        self._draw_text_multiline(surface, "Results", self.font_lg, current_colors["PRIMARY_ACCENT"],
                                   SCREEN_WIDTH // 2, 50)
 
         # Main Stats
-        self._draw_text_multiline(self.screen, f"WPM: {round(self.wpm)}", self.font_md, current_colors["FOREGROUND"],
+        self._draw_text_multiline(surface, f"WPM: {round(self.wpm)}", self.font_md, current_colors["FOREGROUND"],
                                   SCREEN_WIDTH // 2 - 150, 150)
-        self._draw_text_multiline(self.screen, f"Accuracy: {self.accuracy:.1f}%", self.font_md,
+        self._draw_text_multiline(surface, f"Accuracy: {self.accuracy:.1f}%", self.font_md,
                                   current_colors["FOREGROUND"], SCREEN_WIDTH // 2 + 150, 150)
-        self._draw_text_multiline(self.screen, f"Total Time: {round(self.total_time)}s", self.font_md,
+        self._draw_text_multiline(surface, f"Total Time: {round(self.total_time)}s", self.font_md,
                                   current_colors["FOREGROUND"], SCREEN_WIDTH // 2, 200)
-        self._draw_text_multiline(self.screen, f"Total Errors: {self.errors}", self.font_md,
+        self._draw_text_multiline(surface, f"Total Errors: {self.errors}", self.font_md,
                                   current_colors["FOREGROUND"], SCREEN_WIDTH // 2, 250)
 
         # Detailed Errors
-        self._draw_text_multiline(self.screen, "Error Breakdown:", self.font_sm, current_colors["HIGHLIGHT"],
+        self._draw_text_multiline(surface, "Error Breakdown:", self.font_sm, current_colors["HIGHLIGHT"],
                                   SCREEN_WIDTH // 2 - 300, 320, align="left")
-        self._draw_text_multiline(self.screen, f"Substitutions: {self.detailed_errors['substitutions']}", self.font_xs,
+        self._draw_text_multiline(surface, f"Substitutions: {self.detailed_errors['substitutions']}", self.font_xs,
                                   current_colors["FOREGROUND"], SCREEN_WIDTH // 2 - 300, 350, align="left")
-        self._draw_text_multiline(self.screen, f"Insertions: {self.detailed_errors['insertions']}", self.font_xs,
+        self._draw_text_multiline(surface, f"Insertions: {self.detailed_errors['insertions']}", self.font_xs,
                                   current_colors["FOREGROUND"], SCREEN_WIDTH // 2 - 300, 370, align="left")
-        self._draw_text_multiline(self.screen, f"Omissions: {self.detailed_errors['omissions']}", self.font_xs,
+        self._draw_text_multiline(surface, f"Omissions: {self.detailed_errors['omissions']}", self.font_xs,
                                   current_colors["FOREGROUND"], SCREEN_WIDTH // 2 - 300, 390, align="left")
 
+        slowest_bigrams = self.key_latency.slowest_bigrams(SLOWEST_BIGRAMS_SHOWN)
+        if slowest_bigrams:
+            self._draw_text_multiline(surface, "Slowest Key Pairs:", self.font_sm, current_colors["HIGHLIGHT"],
+                                      SCREEN_WIDTH // 2 - 300, 430, align="left")
+            for i, (bigram, mean_ms) in enumerate(slowest_bigrams):
+                self._draw_text_multiline(surface, f"'{bigram}': {mean_ms:.0f} ms", self.font_xs,
+                                          current_colors["FOREGROUND"], SCREEN_WIDTH // 2 - 300, 460 + i * 20,
+                                          align="left")
+
         # WPM Fluctuations Graph
-        self._draw_text_multiline(self.screen, "WPM Fluctuations (WPM vs Time)", self.font_sm,
+        self._draw_text_multiline(surface, "WPM Fluctuations (WPM vs Time)", self.font_sm,
                                   current_colors["HIGHLIGHT"], SCREEN_WIDTH // 2 + 150, 320, align="center")
-        self._draw_wpm_graph(self.screen, SCREEN_WIDTH // 2 + 150, 350, 350, 200)  # Centered x, start y, width, height
-
-        # Draw buttons
-        self.restart_button.draw(self.screen)
-        self.back_to_menu_button.draw(self.screen)
+        self._draw_wpm_graph(surface, SCREEN_WIDTH // 2 + 150, 350, 350, 200)  # Centered x, start y, width, height
 
     def _draw_wpm_graph(self, screen, center_x, start_y, graph_width, graph_height):
         current_colors = self.current_theme_colors
         graph_rect = pygame.Rect(center_x - graph_width // 2, start_y, graph_width, graph_height)
-        pygame.draw.rect(screen, current_colors["SECONDARY"], graph_rect, border_radius=5)  # Graph background
-        pygame.draw.rect(screen, current_colors["FOREGROUND"], graph_rect, 1, border_radius=5)  # Graph border
-
-        if not self.wpm_history:
-            self._draw_text_multiline(screen, "No WPM data", self.font_xs, current_colors["HIGHLIGHT"],
-                                      graph_rect.centerx, graph_rect.centery)
+        screen.blit(self._get_wpm_graph_surface(graph_rect.size), graph_rect)
+        if not self.wpm_timeline:
             return
 
-        # Determine max WPM and max time for scaling
-        max_wpm = max([w for _, w in self.wpm_history]) if self.wpm_history else 1
-        max_time_ms = self.wpm_history[-1][0] if self.wpm_history else 1
-
-        if max_wpm < 50: max_wpm = 50  # Ensure y-axis doesn't get too compressed for low WPM
-        if max_time_ms < 1000: max_time_ms = 1000  # Ensure x-axis for very short tests
-
-        points = []
-        for time_ms, wpm in self.wpm_history:
-            # Map time to x-coordinate (0 to graph_width)
-            x = graph_rect.x + (time_ms / max_time_ms) * graph_width
-            # Map WPM to y-coordinate (graph_height to 0, inverted for drawing)
-            y = graph_rect.y + graph_height - (wpm / max_wpm) * graph_height
-            points.append((x, y))
-
-        if len(points) > 1:
-            pygame.draw.lines(screen, current_colors["PRIMARY_ACCENT"], False, points, 2)
-        elif len(points) == 1:
-            pygame.draw.circle(screen, current_colors["PRIMARY_ACCENT"], points[0], 3)  # Draw a single point
-
         # Draw Y-axis label (WPM)
         self._draw_text_multiline(screen, "WPM", self.font_xs, current_colors["HIGHLIGHT"], graph_rect.x - 20,
                                   graph_rect.centery, align="right")
@@ -894,35 +1824,190 @@ class Game:
         self._draw_text_multiline(screen, "Time (s)", self.font_xs, current_colors["HIGHLIGHT"], graph_rect.centerx,
                                   graph_rect.y + graph_height + 15)
 
+    def _get_wpm_graph_surface(self, size):
+        """The WPM-over-time graph, drawn once per timeline revision (and again after a theme change)."""
+        cache_key = (self.wpm_timeline.revision, size)
+        if self._wpm_graph_cache[0] == cache_key:
+            return self._wpm_graph_cache[1]
+
+        current_colors = self.current_theme_colors
+        graph_width, graph_height = size
+        surface = pygame.Surface(size, pygame.SRCALPHA)
+        self.surface_allocations += 1
+        graph_rect = surface.get_rect()
+        pygame.draw.rect(surface, current_colors["SECONDARY"], graph_rect, border_radius=5)  # Graph background
+        pygame.draw.rect(surface, current_colors["FOREGROUND"], graph_rect, 1, border_radius=5)  # Graph border
+
+        if not self.wpm_timeline:
+            self._draw_text_multiline(surface, "No WPM data", self.font_xs, current_colors["HIGHLIGHT"],
+                                      graph_rect.centerx, graph_rect.centery)
+        else:
+            # Determine max WPM and max time for scaling
+            max_wpm = max(self.wpm_timeline.max_wpm, 50)  # Ensure y-axis doesn't get too compressed for low WPM
+            max_time_ms = max(self.wpm_timeline.last_time_ms, 1000)  # Ensure x-axis for very short tests
+
+            # At most one point per pixel column, chosen to keep the curve's peaks and dips
+            points = [(time_ms / max_time_ms * graph_width, graph_height - wpm / max_wpm * graph_height)
+                      for time_ms, wpm in lttb(self.wpm_timeline.points(), graph_width)]
+            if len(points) > 1:
+                pygame.draw.lines(surface, current_colors["PRIMARY_ACCENT"], False, points, 2)
+            else:
+                pygame.draw.circle(surface, current_colors["PRIMARY_ACCENT"], points[0], 3)  # Draw a single point
+
+        self._wpm_graph_cache = (cache_key, surface)
+        return surface
+
     # --- Dynamic Button Creation ---
     def _create_paragraph_buttons(self):
-        self.paragraph_buttons = []
-        y_offset = 120
-        # Limit paragraph display to fit screen, or add scrolling if many
-        display_limit = int((SCREEN_HEIGHT - y_offset - self.back_to_menu_button.rect.height - 30) / (55))
-        for i, para in enumerate(self.paragraphs[:display_limit]):
-            btn_text = f"P{i + 1}: {para[:60]}..." if len(para) > 60 else f"P{i + 1}: {para}"
-            btn = Button(
-                SCREEN_WIDTH // 2 - 300, y_offset, 600, 45,
-                btn_text, 28, "SECONDARY", "HIGHLIGHT", "FOREGROUND", self
-            )
-            self.paragraph_buttons.append(btn)
-            y_offset += 55
+        """Prepares the picker: a fixed pool of row Buttons, reused as the list scrolls or is filtered."""
+        if not self.paragraph_row_pool:
+            visible_rows = int((SCREEN_HEIGHT - PICKER_LIST_Y - self.back_to_menu_button.rect.height - 30) /
+                               PICKER_ROW_SPACING)
+            for row in range(visible_rows):
+                self.paragraph_row_pool.append(Button(
+                    SCREEN_WIDTH // 2 - 300, PICKER_LIST_Y + row * PICKER_ROW_SPACING, 600, PICKER_ROW_HEIGHT,
+                    "", 28, "SECONDARY", "HIGHLIGHT", "FOREGROUND", self
+                ))
+        if self.search_index is None:
+            source_path = SENTENCES_FILE if isinstance(self.paragraphs, LineCorpus) else None
+            self.search_index = SearchIndex(self.paragraphs, source_path)
+        self._refresh_paragraph_rows()
+
+    def _paragraph_matches(self):
+        """Paragraph indices the picker is listing: the search results, or every paragraph."""
+        if self.paragraph_results is None:
+            return range(len(self.paragraphs))
+        return self.paragraph_results
+
+    def _refresh_paragraph_rows(self):
+        """Points the visible row Buttons at the paragraphs under the current scroll position."""
+        matches = self._paragraph_matches()
+        max_scroll = max(0, len(matches) - len(self.paragraph_row_pool))
+        self.paragraph_scroll = max(0, min(self.paragraph_scroll, max_scroll))
+
+        self._paragraph_row_indices = list(matches[self.paragraph_scroll:
+                                                   self.paragraph_scroll + len(self.paragraph_row_pool)])
+        for btn, paragraph_index in zip(self.paragraph_row_pool, self._paragraph_row_indices):
+            para = self.paragraphs[paragraph_index]
+            prefix = f"P{paragraph_index + 1}: "
+            btn.text = f"{prefix}{para[:60]}..." if len(para) > 60 else f"{prefix}{para}"
+        self.paragraph_buttons = self.paragraph_row_pool[:len(self._paragraph_row_indices)]
+        self.picker_revision += 1
+
+    def _scroll_paragraph_list(self, delta):
+        self.paragraph_scroll += delta
+        self._refresh_paragraph_rows()
+
+    def _run_paragraph_search(self):
+        """Starts searching for paragraph_query; the current rows stay up until the results arrive."""
+        if not self.paragraph_query.strip():
+            self.paragraph_results = None
+            self._search_pending = False
+            self.paragraph_scroll = 0
+            self._refresh_paragraph_rows()
+        else:
+            self.search_index.submit(self.paragraph_query)  # A broad query on a big corpus takes a while
+            self._search_pending = True
+
+    def _poll_paragraph_search(self):
+        result = self.search_index.poll()
+        if result is None:
+            return
+        _, self.paragraph_results = result  # None if the query had no words, i.e. list everything
+        self._search_pending = False
+        self.paragraph_scroll = 0
+        self._refresh_paragraph_rows()
+
+    def _handle_paragraph_picker_key(self, event):
+        page = len(self.paragraph_row_pool)
+        if event.key == K_DOWN:
+            self._scroll_paragraph_list(1)
+        elif event.key == K_UP:
+            self._scroll_paragraph_list(-1)
+        elif event.key == K_PAGEDOWN:
+            self._scroll_paragraph_list(page)
+        elif event.key == K_PAGEUP:
+            self._scroll_paragraph_list(-page)
+        elif event.key == K_RETURN:
+            if self._paragraph_row_indices:
+                self._select_paragraph(self._paragraph_row_indices[0])
+        elif event.key == K_ESCAPE:
+            if self.paragraph_query:
+                self.paragraph_query = ""
+                self._run_paragraph_search()
+            else:
+                self.current_state = MENU
+        elif event.key == K_BACKSPACE:
+            if self.paragraph_query:
+                self.paragraph_query = self.paragraph_query[:-1]
+                self._run_paragraph_search()
+        elif event.unicode and event.unicode.isprintable():
+            if self.font_xs.size(self.paragraph_query + event.unicode)[0] < PICKER_SEARCH_RECT[2] - 20:
+                self.paragraph_query += event.unicode
+                self._run_paragraph_search()
+
+    def load_passage(self, path):
+        """Long-text mode: the whole of a text file (a book chapter, say) becomes the passage until another
+        paragraph is picked. Line breaks and runs of whitespace become single spaces."""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                passage = ' '.join(f.read().split())
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"Error: Could not read passage {path}: {e}")
+            return False
+        if not passage:
+            print(f"Warning: {path} is empty; keeping the selected paragraph.")
+            return False
+        self.passage = passage
+        self.target_paragraph = passage
+        return True
+
+    def _select_paragraph(self, paragraph_index):
+        self.selected_paragraph_index = paragraph_index
+        self.passage = None
+        self.target_paragraph = self.paragraphs[self.selected_paragraph_index]
+        self._get_paragraph_layout()
+        self.current_state = MENU
+
+    def _show_stats(self):
+        """Opens the STATS screen for the current user; stats are computed only if a session was added since."""
+        self.current_state = STATS
+        self.user_stats = None
+        if self.current_user:
+            user_profile = self.profile_cache.get(self.current_user)
+            if user_profile is not None:
+                self.user_stats = self.analytics.get(self.current_user, user_profile["history"])
+
+    def _show_leaderboard(self, view):
+        """Switches the LEADERBOARD screen to view ("overall", "paragraph" or "today")."""
+        if not self.leaderboard_tab_buttons:
+            for i, (tab_view, label) in enumerate(LEADERBOARD_VIEWS.items()):
+                self.leaderboard_tab_buttons[tab_view] = Button(SCREEN_WIDTH // 2 - 330 + i * 225, 85, 210, 45, label,
+                                                                32, "SECONDARY", "HIGHLIGHT", "FOREGROUND", self)
+        self.leaderboard_view = view
+        if view == "paragraph":
+            self.leaderboard_rows = self.leaderboard.top_for_paragraph(paragraph_snippet(self.target_paragraph))
+        elif view == "today":
+            self.leaderboard_rows = self.leaderboard.top_for_day(time.strftime("%Y-%m-%d"))
+        else:
+            self.leaderboard_rows = self.leaderboard.top_overall()
+        for tab_view, btn in self.leaderboard_tab_buttons.items():
+            btn.color_name = "PRIMARY_ACCENT" if tab_view == view else "SECONDARY"
 
     def _create_user_selection_buttons(self):
-        self.user_selection_buttons = []
         y_offset = SCREEN_HEIGHT // 2 + 160  # Below the "Select User" button
 
-        users = list(self.users_data["users"].keys())
+        users = sorted(self.user_index)
 
         if not users:
+            self.user_selection_buttons = []
             return  # No users to make buttons for
 
-        # Sort users alphabetically
-        users.sort()
-
         # Limit number of users displayed on screen for readability
         display_limit = int((SCREEN_HEIGHT - y_offset - self.back_to_menu_button.rect.height - 30) / (55))
+        if [btn.text for btn in self.user_selection_buttons] == users[:display_limit]:
+            return  # Same users as last time, reuse the buttons
+        self.user_selection_buttons = []
 
         for i, user_name in enumerate(users[:display_limit]):
             btn = Button(
@@ -939,17 +2024,97 @@ class Game:
         # Initial theme setup
         self._set_theme(DEFAULT_THEME)
 
+        profiler = self.profiler
         while self.running:
+            if profiler:
+                profiler.start_frame()
             self._handle_events()
+            if profiler:
+                profiler.lap("events")
             self._update_game_state()
-            self._draw_ui()
+            if profiler:
+                profiler.lap("update")
+            self._draw_ui()  # Laps "draw" and "flip" itself, see _present
+            if profiler:
+                profiler.end_frame(self.glyph_cache.misses + self.label_cache.misses, self.surface_allocations)
             clock.tick(FPS)
 
-        pygame.quit()
+        self._shutdown()
         sys.exit()
 
+    def _shutdown(self):
+        """Flushes user data, releases the corpus and reports cache, persistence and profiler numbers."""
+        profiler = self.profiler
+        stats = self.glyph_cache.stats()
+        print(f"Glyph cache: {stats['hits']} hits, {stats['misses']} misses, {stats['evictions']} evictions "
+              f"({stats['hit_rate'] * 100:.1f}% hit rate).")
+        self.user_store.close()
+        self.persistence.stop()
+        if isinstance(self.paragraphs, LineCorpus):
+            self.paragraphs.close()
+        metrics = self.persistence.metrics()
+        print(f"Persistence: {metrics['writes']} writes ({metrics['coalesced']} coalesced, "
+              f"{metrics['failures']} failed), avg {metrics['avg_write_ms']:.1f} ms, "
+              f"max {metrics['max_write_ms']:.1f} ms.")
+        if profiler and profiler.write_summary(PROFILE_SUMMARY_FILE):
+            print(f"Frame profile written to {PROFILE_SUMMARY_FILE}.")
+        self.assets.shutdown()
+        if self.first_frame_ms is not None:
+            assets_ready = f"{self.assets_ready_ms:.0f} ms" if self.assets_ready_ms is not None else "never"
+            print(f"Startup: first frame after {self.first_frame_ms:.0f} ms, assets ready after {assets_ready}.")
+        if self.audio.available:
+            latency = self.audio.latency_summary()
+            print(f"Audio: keystroke-to-sound latency p50 {latency['p50_ms']:.1f} ms, p95 {latency['p95_ms']:.1f} ms, "
+                  f"max {latency['max_ms']:.1f} ms over {latency['count']} sounds (buffer {self.audio.buffer} "
+                  f"samples at {self.audio.frequency} Hz, {self.audio.voices_stolen} voices stolen).")
+        pygame.quit()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Typing Speed Master")
+    parser.add_argument("--profile", action="store_true", help="time every frame; F3 shows the overlay")
+    parser.add_argument("--replay", nargs=2, metavar=("USER", "DATE"),
+                        help='replay a saved session, e.g. --replay alice "2025-06-01 18:30:00"')
+    parser.add_argument("--speed", type=float, default=1, help="replay speed multiplier")
+    parser.add_argument("--headless", action="store_true",
+                        help="re-score the replay as fast as possible without a window and print the results")
+    parser.add_argument("--passage", metavar="FILE",
+                        help="type the whole of a text file (e.g. a book chapter) instead of a paragraph")
+    parser.add_argument("--audio-buffer", type=int, metavar="SAMPLES",
+                        help=f"mixer buffer size; smaller means less sound lag but risks crackles "
+                             f"(default {AUDIO_BUFFER})")
+    args = parser.parse_args(argv)
+    if args.headless and not args.replay:
+        parser.error("--headless needs --replay")
+    if args.speed <= 0:
+        parser.error("--speed must be greater than 0")
+    return args
+
 
 # --- Main execution block ---
 if __name__ == '__main__':
-    game = Game()
+    args = parse_args()
+    if args.headless:
+        os.environ["SDL_VIDEODRIVER"] = "dummy"
+        os.environ["SDL_AUDIODRIVER"] = "dummy"
+    game = Game(profile=args.profile)
+    if args.audio_buffer:
+        game.audio.buffer = args.audio_buffer
+    if args.passage:
+        game.load_passage(args.passage)
+    if args.replay:
+        username, date = args.replay
+        try:
+            log = KeystrokeLog.from_bytes(game.user_store.get_keylog(username, date) or b'')
+        except ValueError as e:
+            print(f"Error: No usable keystroke log for '{username}' at {date}: {e}")
+            game._shutdown()
+            sys.exit(1)
+        if args.headless:
+            results = game.replay_headless(log)
+            print(f"Replay of '{username}' at {date}: {results['wpm']:.1f} WPM, {results['accuracy']:.1f}% accuracy, "
+                  f"{results['errors']} errors in {results['time']:.1f}s; {results['detailed_errors']}")
+            game._shutdown()
+            sys.exit(0)
+        game._start_replay(log, args.speed)
     game.run()
@@ -0,0 +1,156 @@
+import json
+import platform
+import time
+from array import array
+
+PROFILER_FRAMES = 600  # Frames kept in each ring buffer (10 s at 60 FPS)
+PHASES = ("events", "update", "draw", "flip")
+DROPPED_FRAME_FACTOR = 1.5  # A frame interval longer than this many frame budgets counts as dropped frames
+OVERLAY_REFRESH_MS = 250  # How often the overlay's numbers are recomputed
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an ascending sequence."""
+    if not sorted_values:
+        return 0
+    rank = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+class RingBuffer:
+    """The last `capacity` int64 samples, preallocated so recording never allocates."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._values = array('q', bytes(8 * capacity))
+        self._next = 0
+        self.count = 0  # Samples recorded so far, including overwritten ones
+
+    def append(self, value):
+        self._values[self._next] = value
+        self._next = (self._next + 1) % self.capacity
+        self.count += 1
+
+    def values(self):
+        """Samples still in the buffer, oldest first."""
+        if self.count < self.capacity:
+            return self._values[:self.count]
+        return self._values[self._next:] + self._values[:self._next]
+
+
+class FrameProfiler:
+    """Times each phase of Game.run's loop with perf_counter_ns and keeps the last frames in ring buffers.
+
+    run() calls start_frame() at the top of every iteration and lap(phase) after each phase; lap() charges the
+    time since the previous mark to that phase, so a phase may be lapped several times per frame.
+    """
+
+    def __init__(self, fps, capacity=PROFILER_FRAMES):
+        self.fps = fps
+        self.frame_budget_ns = 1_000_000_000 // fps
+        self.capacity = capacity
+        self.phase_times = {phase: RingBuffer(capacity) for phase in PHASES}
+        self.work_times = RingBuffer(capacity)  # events + update + draw + flip
+        self.intervals = RingBuffer(capacity)  # Start-to-start, including clock.tick's sleep
+        self.glyph_renders = RingBuffer(capacity)
+        self.surface_allocations = RingBuffer(capacity)
+        self.dropped_frames = 0
+        self.total_glyph_renders = 0
+        self.total_surface_allocations = 0
+        self._current = dict.fromkeys(PHASES, 0)
+        self._frame_start = 0
+        self._mark = 0
+        self._last_counters = (0, 0)
+        self._started = time.perf_counter_ns()
+        self.overlay_visible = False
+        self._overlay_lines = []
+        self._overlay_refreshed = 0
+
+    def start_frame(self):
+        now = time.perf_counter_ns()
+        if self._frame_start:
+            interval = now - self._frame_start
+            self.intervals.append(interval)
+            if interval > self.frame_budget_ns * DROPPED_FRAME_FACTOR:
+                self.dropped_frames += interval // self.frame_budget_ns - 1
+        self._frame_start = self._mark = now
+
+    def lap(self, phase):
+        now = time.perf_counter_ns()
+        self._current[phase] += now - self._mark
+        self._mark = now
+
+    def end_frame(self, glyph_renders, surface_allocations):
+        """Stores the frame's phase times; the arguments are running totals, of which the per-frame delta is kept."""
+        work = 0
+        for phase, elapsed in self._current.items():
+            self.phase_times[phase].append(elapsed)
+            work += elapsed
+            self._current[phase] = 0
+        self.work_times.append(work)
+        glyphs = glyph_renders - self._last_counters[0]
+        surfaces = surface_allocations - self._last_counters[1]
+        self._last_counters = (glyph_renders, surface_allocations)
+        self.glyph_renders.append(glyphs)
+        self.surface_allocations.append(surfaces)
+        self.total_glyph_renders += glyphs
+        self.total_surface_allocations += surfaces
+
+    def toggle_overlay(self):
+        self.overlay_visible = not self.overlay_visible
+        self._overlay_refreshed = 0
+
+    def overlay_lines(self):
+        """Text for the overlay, recomputed at most every OVERLAY_REFRESH_MS."""
+        now = time.perf_counter_ns()
+        if now - self._overlay_refreshed >= OVERLAY_REFRESH_MS * 1_000_000:
+            self._overlay_refreshed = now
+            frame = self._stats(self.work_times)
+            interval = self._stats(self.intervals)
+            draw = self._stats(self.phase_times["draw"])
+            self._overlay_lines = [
+                f"frame p50 {frame['p50_ms']:.2f}  p95 {frame['p95_ms']:.2f}  p99 {frame['p99_ms']:.2f} ms",
+                f"draw p95 {draw['p95_ms']:.2f} ms  interval p99 {interval['p99_ms']:.1f} ms",
+                f"dropped {self.dropped_frames} (target {self.fps} FPS)",
+                f"glyphs {sum(self.glyph_renders.values())}  surfaces {sum(self.surface_allocations.values())}"
+                f" / last {self.capacity} frames",
+            ]
+        return self._overlay_lines
+
+    def _stats(self, buffer):
+        ordered = sorted(buffer.values())
+        to_ms = lambda ns: round(ns / 1_000_000, 3)
+        return {
+            "frames": len(ordered),
+            "mean_ms": to_ms(sum(ordered) / len(ordered)) if ordered else 0,
+            "p50_ms": to_ms(percentile(ordered, 0.50)),
+            "p95_ms": to_ms(percentile(ordered, 0.95)),
+            "p99_ms": to_ms(percentile(ordered, 0.99)),
+            "max_ms": to_ms(ordered[-1]) if ordered else 0,
+        }
+
+    def summary(self):
+        return {
+            "recorded": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "target_fps": self.fps,
+            "frames": self.work_times.count,
+            "run_time_s": round((time.perf_counter_ns() - self._started) / 1e9, 3),
+            "dropped_frames": self.dropped_frames,
+            "glyph_renders": self.total_glyph_renders,
+            "surface_allocations": self.total_surface_allocations,
+            "window_frames": len(self.work_times.values()),  # The stats below cover only the last window
+            "frame": self._stats(self.work_times),
+            "interval": self._stats(self.intervals),
+            "phases": {phase: self._stats(buffer) for phase, buffer in self.phase_times.items()},
+        }
+
+    def write_summary(self, path):
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(self.summary(), f, indent=4)
+        except OSError as e:
+            print(f"Warning: Could not write profile summary {path}: {e}")
+            return False
+        return True
@@ -0,0 +1,68 @@
+import time
+
+from pygame.locals import K_BACKSPACE, K_RETURN
+
+from keylog import BACKSPACE, FINISH
+
+REPLAY_SPEEDS = (0.25, 0.5, 1, 2, 4, 8, 16)  # Up/Down step through these during a replay
+
+
+class Replay:
+    """Plays a KeystrokeLog back on its own clock, which runs at `speed` times real time.
+
+    speed=None replays headless: every keystroke is due at once and the clock jumps to each one's recorded
+    time. The finishing keystroke always sets the clock to its recorded time, so the final WPM and total
+    time match the original run however fast it is played.
+    """
+
+    def __init__(self, log, speed=1):
+        self.log = log
+        self.speed = speed
+        self.position = 0  # Next keystroke to hand out
+        self.clock_ns = 0  # Replay time, comparable to the log's timestamps
+        self._last_wall_ns = 0
+
+    def start(self):
+        self.position = 0
+        self.clock_ns = 0
+        self._last_wall_ns = time.perf_counter_ns()
+
+    def advance(self):
+        """Moves the replay clock forward by the wall time since the last call, scaled by speed."""
+        now = time.perf_counter_ns()
+        if self.speed is not None:
+            self.clock_ns += int((now - self._last_wall_ns) * self.speed)
+        self._last_wall_ns = now
+
+    def set_speed(self, speed):
+        self.advance()  # Time so far counts at the old speed
+        self.speed = speed
+
+    def step_speed(self, direction):
+        """Moves to the next faster (direction=1) or slower (-1) entry of REPLAY_SPEEDS."""
+        speeds = list(REPLAY_SPEEDS)
+        current = min(range(len(speeds)), key=lambda i: abs(speeds[i] - (self.speed or speeds[-1])))
+        self.set_speed(speeds[max(0, min(len(speeds) - 1, current + direction))])
+
+    @property
+    def elapsed_seconds(self):
+        return self.clock_ns / 1e9
+
+    def due(self):
+        """Yields (key, unicode) for every keystroke whose recorded time has been reached, like KEYDOWN events."""
+        log = self.log
+        while self.position < len(log):
+            i = self.position
+            timestamp = log.timestamps[i]
+            if self.speed is not None and timestamp > self.clock_ns:
+                return
+            self.position += 1
+            flags = log.flags[i]
+            if self.speed is None or flags & FINISH:
+                self.clock_ns = timestamp
+            if flags & FINISH:
+                yield K_RETURN, '\r'
+            elif flags & BACKSPACE:
+                yield K_BACKSPACE, '\b'
+            else:
+                yield 0, chr(log.codepoints[i])
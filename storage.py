@@ -0,0 +1,683 @@
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import tempfile
+import threading
+import heapq
+import time
+import uuid
+from collections import OrderedDict, deque
+
+# A session is a dict: {'wpm', 'accuracy', 'time', 'errors', 'paragraph', 'date'}
+# A profile is a dict: {'high_wpm', 'low_wpm'} (low_wpm is float('inf') until a non-zero session exists)
+# A session's keystroke log (see keylog.KeystrokeLog.to_bytes) is stored beside it, never inside the dict
+
+JSON_HISTORY_LIMIT = 50  # users.json keeps only the most recent sessions per user
+PROFILE_CACHE_SIZE = 8  # Fully loaded profiles (with history) kept in memory
+PARAGRAPH_SNIPPET_LENGTH = 50  # Sessions store this much of the paragraph; it also keys per-paragraph leaderboards
+KEYLOG_SUFFIX = '.tsk'  # JsonUserStore keeps one keystroke log file per session
+LATENCY_SUFFIX = '.lat'  # ...and one key latency file per user
+
+
+def paragraph_snippet(paragraph):
+    """The shortened paragraph text stored with each session."""
+    if len(paragraph) > PARAGRAPH_SNIPPET_LENGTH:
+        return paragraph[:PARAGRAPH_SNIPPET_LENGTH] + "..."
+    return paragraph
+
+# How hard writes try to reach the disk before being considered done:
+#   "always" - fsync the file and its directory, "file" - fsync the file only, "never" - leave it to the OS
+FSYNC_POLICIES = ("always", "file", "never")
+SQLITE_SYNCHRONOUS = {"always": "FULL", "file": "NORMAL", "never": "OFF"}
+
+
+def atomic_write(path, data, fsync_policy="file"):
+    """Writes data (str or bytes) to path via a temp file in the same directory and an atomic rename."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb' if isinstance(data, bytes) else 'w') as f:
+            f.write(data)
+            f.flush()
+            if fsync_policy != "never":
+                os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    if fsync_policy == "always" and hasattr(os, 'O_DIRECTORY'):  # Persist the rename itself (POSIX only)
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+class PersistenceWorker:
+    """Background thread that runs storage writes off the frame loop.
+
+    Jobs submitted with the same coalesce_key while one is still queued replace it, so a burst of
+    writes to the same file or table turns into a single write.
+    """
+
+    def __init__(self, latency_samples=100):
+        self._queue = queue.Queue()
+        self._pending = {}  # {coalesce_key: job} for keys waiting in the queue
+        self._pending_lock = threading.Lock()
+        self.write_latencies_ms = deque(maxlen=latency_samples)
+        self.writes = 0
+        self.coalesced = 0
+        self.failures = 0
+        self._thread = threading.Thread(target=self._run, name="persistence", daemon=True)
+        self._thread.start()
+
+    def submit(self, job, coalesce_key=None):
+        """Queues job (a callable) to run on the worker thread."""
+        if coalesce_key is None:
+            coalesce_key = object()  # Unique, never coalesced
+        with self._pending_lock:
+            already_queued = coalesce_key in self._pending
+            self._pending[coalesce_key] = job
+            if already_queued:
+                self.coalesced += 1
+                return
+        self._queue.put(coalesce_key)
+
+    def _run(self):
+        while True:
+            coalesce_key = self._queue.get()
+            try:
+                if coalesce_key is None:
+                    return  # Stop sentinel
+                with self._pending_lock:
+                    job = self._pending.pop(coalesce_key)
+                start = time.perf_counter()
+                try:
+                    job()
+                    self.writes += 1
+                except Exception as e:  # Keep the worker alive; the game has no way to recover a failed write
+                    self.failures += 1
+                    print(f"Error: Background save failed: {e}")
+                self.write_latencies_ms.append((time.perf_counter() - start) * 1000)
+            finally:
+                self._queue.task_done()
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def flush(self):
+        """Blocks until every queued write has finished."""
+        self._queue.join()
+
+    def stop(self):
+        """Flushes outstanding writes and ends the worker thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def metrics(self):
+        latencies = list(self.write_latencies_ms)
+        return {
+            "queue_depth": self.queue_depth,
+            "writes": self.writes,
+            "coalesced": self.coalesced,
+            "failures": self.failures,
+            "last_write_ms": latencies[-1] if latencies else 0.0,
+            "avg_write_ms": sum(latencies) / len(latencies) if latencies else 0.0,
+            "max_write_ms": max(latencies, default=0.0),
+        }
+
+
+class UserStore:
+    """Interface the game uses to read and write user profiles and their session history."""
+
+    def list_users(self):
+        """Returns all usernames, sorted alphabetically."""
+        raise NotImplementedError
+
+    def load_index(self):
+        """Returns {username: profile} for every user, without loading any history."""
+        return {username: self.get_profile(username) for username in self.list_users()}
+
+    def get_profile(self, username):
+        """Returns {'high_wpm', 'low_wpm'} for username, or None if the user doesn't exist."""
+        raise NotImplementedError
+
+    def create_user(self, username):
+        """Creates an empty profile. Returns False if the user already exists."""
+        raise NotImplementedError
+
+    def add_session(self, username, session, keylog=None):
+        """Records one finished test (and its keystroke log bytes, if any) for username; returns the updated profile."""
+        raise NotImplementedError
+
+    def get_keylog(self, username, date):
+        """Returns the keystroke log bytes of username's session at date ("YYYY-MM-DD HH:MM:SS"), or None."""
+        raise NotImplementedError
+
+    def get_history(self, username, limit=None):
+        """Returns username's sessions oldest first; with limit, only the most recent ones."""
+        raise NotImplementedError
+
+    def get_key_latency(self, username):
+        """Returns the bytes last saved by save_key_latency for username, or None."""
+        raise NotImplementedError
+
+    def save_key_latency(self, username, data):
+        """Replaces username's cumulative key latency data (see latency.KeyLatency.to_bytes)."""
+        raise NotImplementedError
+
+    def top_sessions(self, limit, paragraph=None, day=None):
+        """Returns the fastest sessions of all users (each with a 'username'), fastest first.
+
+        paragraph restricts to sessions on that stored snippet, day ("YYYY-MM-DD") to that date.
+        """
+        raise NotImplementedError
+
+    def flush(self):
+        """Blocks until writes handed to a background worker have reached the disk."""
+        pass
+
+    def close(self):
+        self.flush()
+
+
+class JsonUserStore(UserStore):
+    """Legacy backend: the whole users.json is kept in memory and rewritten after every change."""
+
+    def __init__(self, path, worker=None, fsync_policy="file"):
+        self.path = path
+        self.worker = worker  # With a worker, saves are coalesced and written in the background
+        self.fsync_policy = fsync_policy
+        self._lock = threading.Lock()  # Guards users_data against the worker serialising it mid-update
+        self.users_data = self._load()
+        self.keylog_dir = os.path.splitext(path)[0] + "_keylogs"
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            print(f"No {self.path} found or file corrupted. Starting with empty user data.")
+            return {"users": {}}
+
+    def _save(self):
+        if self.worker:
+            self.worker.submit(self._write, coalesce_key=("json", self.path))
+        else:
+            self._write()
+
+    def _write(self):
+        with self._lock:
+            data = json.dumps(self.users_data, indent=4)
+        try:
+            atomic_write(self.path, data, self.fsync_policy)
+        except (IOError, OSError):
+            print(f"Error: Could not save user data to {self.path}.")
+
+    def flush(self):
+        if self.worker:
+            self.worker.flush()
+
+    def list_users(self):
+        return sorted(self.users_data["users"])
+
+    def get_profile(self, username):
+        user_profile = self.users_data["users"].get(username)
+        if user_profile is None:
+            return None
+        return {"high_wpm": user_profile.get("high_wpm", 0), "low_wpm": user_profile.get("low_wpm", float('inf'))}
+
+    def create_user(self, username):
+        if username in self.users_data["users"]:
+            return False
+        with self._lock:
+            self.users_data["users"][username] = {
+                "high_wpm": 0,
+                "low_wpm": float('inf'),  # Store as inf for proper comparison, handle during display
+                "history": []
+            }
+        self._save()
+        return True
+
+    def add_session(self, username, session, keylog=None):
+        user_profile = self.users_data["users"][username]
+        wpm = session["wpm"]
+        keylog_name = uuid.uuid4().hex + KEYLOG_SUFFIX if keylog else None
+
+        with self._lock:
+            # Update high/low WPM
+            if wpm > user_profile["high_wpm"]:
+                user_profile["high_wpm"] = wpm
+            if wpm < user_profile["low_wpm"] and wpm > 0:
+                user_profile["low_wpm"] = wpm
+
+            entry = {
+                "wpm": round(wpm),
+                "accuracy": round(session["accuracy"], 1),
+                "time": round(session["time"], 1),
+                "errors": session["errors"],
+                "paragraph": session["paragraph"],
+                "date": session["date"]
+            }
+            if keylog_name:
+                entry["keylog"] = keylog_name
+            user_profile["history"].append(entry)
+            dropped = user_profile["history"][:-JSON_HISTORY_LIMIT]
+            user_profile["history"] = user_profile["history"][-JSON_HISTORY_LIMIT:]  # Keep last entries only
+
+        stale = [entry["keylog"] for entry in dropped if entry.get("keylog")]
+        if keylog or stale:
+            job = lambda: self._write_keylogs(keylog_name, keylog, stale)
+            if self.worker:
+                self.worker.submit(job)
+            else:
+                job()
+        self._save()
+        return self.get_profile(username)
+
+    def _write_keylogs(self, name, keylog, stale):
+        """Writes a new log file and removes those of sessions that fell out of the history."""
+        try:
+            if keylog:
+                os.makedirs(self.keylog_dir, exist_ok=True)
+                with open(os.path.join(self.keylog_dir, name), 'wb') as f:
+                    f.write(keylog)
+            for stale_name in stale:
+                os.remove(os.path.join(self.keylog_dir, stale_name))
+        except OSError as e:
+            print(f"Error: Could not save keystroke log in {self.keylog_dir}: {e}")
+
+    def get_keylog(self, username, date):
+        self.flush()
+        for entry in reversed(self.users_data["users"].get(username, {}).get("history", [])):
+            if entry.get("date") == date and entry.get("keylog"):
+                try:
+                    with open(os.path.join(self.keylog_dir, entry["keylog"]), 'rb') as f:
+                        return f.read()
+                except OSError:
+                    return None
+        return None
+
+    def get_history(self, username, limit=None):
+        history = self.users_data["users"].get(username, {}).get("history", [])
+        return list(history[-limit:] if limit else history)
+
+    def _latency_path(self, username):
+        return os.path.join(self.keylog_dir, hashlib.sha1(username.encode('utf-8')).hexdigest() + LATENCY_SUFFIX)
+
+    def get_key_latency(self, username):
+        self.flush()
+        try:
+            with open(self._latency_path(username), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def save_key_latency(self, username, data):
+        def write():
+            try:
+                os.makedirs(self.keylog_dir, exist_ok=True)
+                atomic_write(self._latency_path(username), data, self.fsync_policy)
+            except OSError as e:
+                print(f"Error: Could not save key latency data for '{username}': {e}")
+        if self.worker:
+            self.worker.submit(write, coalesce_key=("latency", self.path, username))
+        else:
+            write()
+
+    def top_sessions(self, limit, paragraph=None, day=None):
+        # No index to use here; the legacy file is already fully in memory
+        sessions = (dict(entry, username=username)
+                    for username, user_profile in self.users_data["users"].items()
+                    for entry in user_profile.get("history", [])
+                    if (paragraph is None or entry.get("paragraph") == paragraph) and
+                    (day is None or entry.get("date", "").startswith(day)))
+        return heapq.nlargest(limit, sessions, key=lambda entry: entry.get("wpm", 0))
+
+
+class SQLiteUserStore(UserStore):
+    """One row per session in an indexed SQLite database; history is never truncated."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            created TEXT NOT NULL,
+            legacy_high_wpm REAL,  -- Imported from users.json, may predate the imported history
+            legacy_low_wpm REAL
+        );
+        CREATE TABLE IF NOT EXISTS sessions (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(id),
+            date TEXT NOT NULL,
+            wpm REAL NOT NULL,
+            accuracy REAL NOT NULL,
+            time REAL NOT NULL,
+            errors INTEGER NOT NULL,
+            paragraph TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_sessions_user_date ON sessions(user_id, date);
+        CREATE INDEX IF NOT EXISTS idx_sessions_user_wpm ON sessions(user_id, wpm);
+        CREATE INDEX IF NOT EXISTS idx_sessions_wpm ON sessions(wpm);
+        CREATE INDEX IF NOT EXISTS idx_sessions_paragraph_wpm ON sessions(paragraph, wpm);
+        CREATE INDEX IF NOT EXISTS idx_sessions_date ON sessions(date);
+        CREATE TABLE IF NOT EXISTS keylogs (
+            session_id INTEGER PRIMARY KEY REFERENCES sessions(id),  -- Kept apart so history queries stay small
+            data BLOB NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS key_latency (
+            user_id INTEGER PRIMARY KEY REFERENCES users(id),
+            data BLOB NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, path, worker=None, fsync_policy="file"):
+        self.path = path
+        self.worker = worker  # With a worker, session inserts are batched and run in the background
+        # The connection is shared with the worker thread, so every use goes through self._lock
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self._lock = threading.RLock()
+        self._pending_sessions = []  # [(username, session, keylog)] not yet handed to SQLite
+        self._pending_latency = {}  # {username: data} not yet handed to SQLite
+        self._profiles = {}  # {username: profile} so add_session can answer without waiting for the write
+        with self._lock:
+            self.conn.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS.get(fsync_policy, 'NORMAL')}")
+            self.conn.executescript(self.SCHEMA)
+            self.conn.commit()
+
+    def _user_id(self, username):
+        with self._lock:
+            row = self.conn.execute("SELECT id FROM users WHERE name = ?", (username,)).fetchone()
+        return row["id"] if row else None
+
+    def list_users(self):
+        with self._lock:
+            return [row["name"] for row in self.conn.execute("SELECT name FROM users ORDER BY name")]
+
+    def load_index(self):
+        # One pass over users; each correlated MIN/MAX is a single idx_sessions_user_wpm lookup
+        with self._lock:
+            rows = self.conn.execute("""
+                SELECT name, legacy_high_wpm, legacy_low_wpm,
+                       (SELECT MAX(wpm) FROM sessions WHERE user_id = users.id) AS high,
+                       (SELECT MIN(wpm) FROM sessions WHERE user_id = users.id AND wpm > 0) AS low
+                FROM users ORDER BY name
+            """).fetchall()
+        index = {}
+        for row in rows:
+            high_candidates = [v for v in (row["high"], row["legacy_high_wpm"]) if v is not None]
+            low_candidates = [v for v in (row["low"], row["legacy_low_wpm"]) if v is not None]
+            index[row["name"]] = {"high_wpm": max(high_candidates, default=0),
+                                  "low_wpm": min(low_candidates, default=float('inf'))}
+        self._profiles.update((name, dict(profile)) for name, profile in index.items())
+        return index
+
+    def get_profile(self, username):
+        if username in self._profiles:
+            return dict(self._profiles[username])
+        with self._lock:
+            user = self.conn.execute("SELECT id, legacy_high_wpm, legacy_low_wpm FROM users WHERE name = ?",
+                                     (username,)).fetchone()
+            if user is None:
+                return None
+            # Both lookups are answered from idx_sessions_user_wpm without scanning the history
+            high = self.conn.execute("SELECT MAX(wpm) FROM sessions WHERE user_id = ?", (user["id"],)).fetchone()[0]
+            low = self.conn.execute("SELECT MIN(wpm) FROM sessions WHERE user_id = ? AND wpm > 0",
+                                    (user["id"],)).fetchone()[0]
+        high_candidates = [v for v in (high, user["legacy_high_wpm"]) if v is not None]
+        low_candidates = [v for v in (low, user["legacy_low_wpm"]) if v is not None]
+        profile = {"high_wpm": max(high_candidates, default=0), "low_wpm": min(low_candidates, default=float('inf'))}
+        self._profiles[username] = profile
+        return dict(profile)
+
+    def create_user(self, username, legacy_high_wpm=None, legacy_low_wpm=None):
+        try:
+            with self._lock, self.conn:
+                self.conn.execute(
+                    "INSERT INTO users (name, created, legacy_high_wpm, legacy_low_wpm) VALUES (?, ?, ?, ?)",
+                    (username, time.strftime("%Y-%m-%d %H:%M:%S"), legacy_high_wpm, legacy_low_wpm))
+            return True
+        except sqlite3.IntegrityError:
+            return False
+
+    def add_session(self, username, session, keylog=None):
+        profile = self.get_profile(username)
+        if profile is None:
+            raise KeyError(username)
+        if session["wpm"] > profile["high_wpm"]:
+            profile["high_wpm"] = session["wpm"]
+        if 0 < session["wpm"] < profile["low_wpm"]:
+            profile["low_wpm"] = session["wpm"]
+        self._profiles[username] = profile
+
+        with self._lock:
+            self._pending_sessions.append((username, session, keylog))
+        if self.worker:
+            # Sessions queued while a write is pending join the same transaction
+            self.worker.submit(self._write_pending_sessions, coalesce_key=("sessions", self.path))
+        else:
+            self._write_pending_sessions()
+        return dict(profile)
+
+    def _write_pending_sessions(self):
+        with self._lock:
+            pending, self._pending_sessions = self._pending_sessions, []
+            if not pending:
+                return
+            user_ids = {}
+            for username, _, _ in pending:
+                if username not in user_ids:
+                    user_ids[username] = self._user_id(username)
+            with self.conn:
+                for username, s, keylog in pending:
+                    cursor = self.conn.execute(
+                        "INSERT INTO sessions (user_id, date, wpm, accuracy, time, errors, paragraph) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (user_ids[username], s["date"], s["wpm"], s["accuracy"], s["time"], s["errors"],
+                         s["paragraph"]))
+                    if keylog:
+                        self.conn.execute("INSERT INTO keylogs (session_id, data) VALUES (?, ?)",
+                                          (cursor.lastrowid, keylog))
+
+    def add_sessions(self, username, sessions):
+        """Inserts several sessions for one user in a single, synchronous transaction (used by the importer)."""
+        user_id = self._user_id(username)
+        if user_id is None:
+            raise KeyError(username)
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT INTO sessions (user_id, date, wpm, accuracy, time, errors, paragraph) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(user_id, s["date"], s["wpm"], s["accuracy"], s["time"], s["errors"], s["paragraph"])
+                 for s in sessions])
+        self._profiles.pop(username, None)
+
+    # Reads answer from the committed rows plus what is still pending in memory, both under self._lock, instead
+    # of flushing: the worker only holds the lock for one transaction, so a read never waits for the whole queue
+
+    def get_history(self, username, limit=None):
+        query = ("SELECT date, wpm, accuracy, time, errors, paragraph FROM sessions "
+                 "WHERE user_id = (SELECT id FROM users WHERE name = ?) ORDER BY date DESC, id DESC")
+        params = (username,)
+        if limit:
+            query += " LIMIT ?"
+            params += (limit,)
+        with self._lock:
+            rows = self.conn.execute(query, params).fetchall()
+            pending = [dict(s) for name, s, _ in self._pending_sessions if name == username]
+        history = [dict(row) for row in reversed(rows)] + pending
+        history.sort(key=lambda s: s["date"])  # Stable, so pending sessions stay after committed ones
+        return history[-limit:] if limit else history
+
+    def get_keylog(self, username, date):
+        with self._lock:
+            for name, s, keylog in reversed(self._pending_sessions):
+                if name == username and s["date"] == date and keylog:
+                    return keylog
+            # idx_sessions_user_date finds the session, the keylogs primary key its log
+            row = self.conn.execute(
+                "SELECT data FROM keylogs JOIN sessions ON sessions.id = keylogs.session_id "
+                "WHERE sessions.user_id = (SELECT id FROM users WHERE name = ?) AND sessions.date = ? "
+                "ORDER BY sessions.id DESC LIMIT 1", (username, date)).fetchone()
+        return row["data"] if row else None
+
+    def get_key_latency(self, username):
+        with self._lock:
+            if username in self._pending_latency:
+                return self._pending_latency[username]
+            row = self.conn.execute("SELECT data FROM key_latency JOIN users ON users.id = key_latency.user_id "
+                                    "WHERE users.name = ?", (username,)).fetchone()
+        return row["data"] if row else None
+
+    def save_key_latency(self, username, data):
+        def write():
+            with self._lock:
+                with self.conn:
+                    self.conn.execute("INSERT OR REPLACE INTO key_latency (user_id, data) "
+                                      "SELECT id, ? FROM users WHERE name = ?", (data, username))
+                if self._pending_latency.get(username) is data:  # Unless a newer save is already waiting
+                    del self._pending_latency[username]
+        with self._lock:
+            self._pending_latency[username] = data
+        if self.worker:
+            self.worker.submit(write, coalesce_key=("latency", self.path, username))
+        else:
+            write()
+
+    def top_sessions(self, limit, paragraph=None, day=None):
+        # Overall walks idx_sessions_wpm backwards, per paragraph idx_sessions_paragraph_wpm; per day
+        # idx_sessions_date narrows to that day's sessions before sorting them
+        query = ("SELECT users.name AS username, date, wpm, accuracy, time, errors, paragraph "
+                 "FROM sessions JOIN users ON users.id = sessions.user_id")
+        conditions, params = [], []
+        if paragraph is not None:
+            conditions.append("paragraph = ?")
+            params.append(paragraph)
+        if day is not None:
+            conditions.append("date >= ? AND date < ?")
+            params += [day, day + "~"]  # "~" sorts after the " HH:MM:SS" time part
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY wpm DESC, sessions.id ASC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self.conn.execute(query, params).fetchall()
+            pending = [dict(s, username=name) for name, s, _ in self._pending_sessions
+                       if (paragraph is None or s["paragraph"] == paragraph)
+                       and (day is None or day <= s["date"] < day + "~")]
+        sessions = [dict(row) for row in rows] + pending
+        sessions.sort(key=lambda s: -s["wpm"])  # Stable, so committed sessions win ties as they do in SQL
+        return sessions[:limit]
+
+    def get_meta(self, key):
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+
+    def set_meta(self, key, value):
+        with self._lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def flush(self):
+        if self.worker:
+            self.worker.flush()
+        self._write_pending_sessions()
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self.conn.close()
+
+
+class ProfileCache:
+    """Bounded LRU of fully loaded profiles: {'high_wpm', 'low_wpm', 'history'}; loaded on first use."""
+
+    def __init__(self, store, max_size=PROFILE_CACHE_SIZE):
+        self.store = store
+        self.max_size = max_size
+        self._profiles = OrderedDict()
+
+    def get(self, username):
+        """Returns username's full profile, loading its history from the store if it isn't cached."""
+        profile = self._profiles.get(username)
+        if profile is not None:
+            self._profiles.move_to_end(username)
+            return profile
+        summary = self.store.get_profile(username)
+        if summary is None:
+            return None
+        profile = dict(summary, history=self.store.get_history(username))
+        self._profiles[username] = profile
+        if len(self._profiles) > self.max_size:
+            self._profiles.popitem(last=False)
+        return profile
+
+    def record_session(self, username, session, summary):
+        """Keeps a cached profile in step with a session just added to the store."""
+        profile = self._profiles.get(username)
+        if profile is not None:
+            profile.update(summary)
+            profile["history"].append(session)
+
+    def __contains__(self, username):
+        return username in self._profiles
+
+
+def import_users_json(json_path, store):
+    """Copies every profile and session from a users.json file into store. Returns (users, sessions) imported."""
+    with open(json_path, 'r') as f:
+        users_data = json.load(f)
+
+    imported_users = imported_sessions = 0
+    for username, user_profile in users_data.get("users", {}).items():
+        low_wpm = user_profile.get("low_wpm")
+        if low_wpm is not None and low_wpm == float('inf'):
+            low_wpm = None
+        if not store.create_user(username, user_profile.get("high_wpm"), low_wpm):
+            print(f"Warning: User '{username}' already exists, skipping import of that profile.")
+            continue
+        history = user_profile.get("history", [])
+        store.add_sessions(username, [{
+            "wpm": entry.get("wpm", 0),
+            "accuracy": entry.get("accuracy", 0.0),
+            "time": entry.get("time", 0.0),
+            "errors": entry.get("errors", 0),
+            "paragraph": entry.get("paragraph", ""),
+            "date": entry.get("date", ""),
+        } for entry in history])
+        imported_users += 1
+        imported_sessions += len(history)
+    return imported_users, imported_sessions
+
+
+def open_user_store(backend, json_path, db_path, worker=None, fsync_policy="file"):
+    """Opens the configured backend. A new SQLite database imports json_path once if it exists."""
+    if fsync_policy not in FSYNC_POLICIES:
+        print(f"Warning: Unknown fsync policy '{fsync_policy}'. Using 'file'.")
+        fsync_policy = "file"
+    if backend == "json":
+        return JsonUserStore(json_path, worker, fsync_policy)
+    if backend != "sqlite":
+        print(f"Warning: Unknown storage backend '{backend}'. Using sqlite.")
+
+    store = SQLiteUserStore(db_path, worker, fsync_policy)
+    if store.get_meta("imported_users_json") is None:
+        if os.path.exists(json_path):
+            try:
+                users, sessions = import_users_json(json_path, store)
+                print(f"Imported {users} users and {sessions} sessions from {json_path} into {db_path}.")
+            except (IOError, json.JSONDecodeError) as e:
+                print(f"Warning: Could not import {json_path}: {e}")
+        store.set_meta("imported_users_json", time.strftime("%Y-%m-%d %H:%M:%S"))
+    return store
@@ -0,0 +1,98 @@
+from array import array
+
+TIMELINE_CAPACITY = 512  # Samples kept per test, however long it runs
+TIMELINE_INTERVAL_MS = 1000  # Starting gap between samples; doubles every time the buffer fills
+
+
+class WpmTimeline:
+    """(time_ms, wpm) samples of one typing test in preallocated, fixed-size arrays.
+
+    A sample is taken every interval_ms. When the arrays fill up, neighbouring pairs are merged into their
+    mean and the interval doubles, so an hour-long session keeps the same memory and the same number of
+    evenly spaced points as a one-minute test.
+    """
+
+    def __init__(self, capacity=TIMELINE_CAPACITY, interval_ms=TIMELINE_INTERVAL_MS):
+        self.capacity = capacity
+        self.base_interval_ms = interval_ms
+        self._times = array('d', bytes(8 * capacity))
+        self._wpms = array('d', bytes(8 * capacity))
+        self.revision = 0  # Bumped on every change, resets included, for caches drawn from the samples
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.interval_ms = self.base_interval_ms
+        self.revision += 1  # Never reused, so a new test can't match a cache key from the previous one
+
+    def __len__(self):
+        return self.count
+
+    def add(self, time_ms, wpm):
+        """Records a sample if interval_ms has passed since the last one."""
+        if self.count and time_ms - self._times[self.count - 1] < self.interval_ms:
+            return
+        if self.count == self.capacity:
+            self._merge()
+        self._times[self.count] = time_ms
+        self._wpms[self.count] = wpm
+        self.count += 1
+        self.revision += 1
+
+    def _merge(self):
+        """Halves the resolution in place: sample i becomes the mean of samples 2i and 2i+1."""
+        times, wpms = self._times, self._wpms
+        pairs = self.count // 2
+        for i in range(pairs):
+            times[i] = (times[2 * i] + times[2 * i + 1]) / 2
+            wpms[i] = (wpms[2 * i] + wpms[2 * i + 1]) / 2
+        if self.count % 2:  # An odd sample out is carried over as it is
+            times[pairs] = times[self.count - 1]
+            wpms[pairs] = wpms[self.count - 1]
+        self.count = pairs + self.count % 2
+        self.interval_ms *= 2
+
+    @property
+    def last_time_ms(self):
+        return self._times[self.count - 1] if self.count else 0
+
+    @property
+    def max_wpm(self):
+        return max(self._wpms[:self.count]) if self.count else 0
+
+    def points(self):
+        """[(time_ms, wpm)], oldest first."""
+        return list(zip(self._times[:self.count], self._wpms[:self.count]))
+
+
+def lttb(points, threshold):
+    """Largest-Triangle-Three-Buckets downsampling of [(x, y)] (ascending x) to at most threshold points.
+
+    Keeps the first and last points and, from each bucket in between, the point forming the largest triangle
+    with the previously kept point and the next bucket's mean, which preserves peaks and dips far better
+    than taking every n-th point.
+    """
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return list(points)
+    sampled = [points[0]]
+    bucket_size = (n - 2) / (threshold - 2)
+    a = 0  # Index of the last kept point
+    for i in range(threshold - 2):
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+        next_bucket = points[end:next_end]
+        mean_x = sum(x for x, _ in next_bucket) / len(next_bucket)
+        mean_y = sum(y for _, y in next_bucket) / len(next_bucket)
+        ax, ay = points[a]
+        best_area, best = -1, start
+        for j in range(start, end):
+            x, y = points[j]
+            area = abs((ax - mean_x) * (y - ay) - (ax - x) * (mean_y - ay))
+            if area > best_area:
+                best_area, best = area, j
+        sampled.append(points[best])
+        a = best
+    sampled.append(points[-1])
+    return sampled